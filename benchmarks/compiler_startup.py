@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Measures the startup time of the compiler, with and without the cached parser tables, and the time of a
+compile cache hit.
+Usage (from the repo root): python benchmarks/compiler_startup.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join("code_tests", "functions-test.parhl")
+
+def timed_run(cmd, cache_dir):
+    env = os.environ | {"PARHL_CACHE_DIR": cache_dir}
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=REPO_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def bench(name, cmd, runs, labels=("no cache", "cached tables")):
+    cold, warm = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(timed_run(cmd, cache_dir)) # tables built and stored
+            warm.append(timed_run(cmd, cache_dir)) # tables loaded
+    print(f"{name:<36} {labels[0]}: {sum(cold) / runs * 1000:7.1f} ms   {labels[1]}: {sum(warm) / runs * 1000:7.1f} ms")
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bench("import parser", [sys.executable, "-c", "import lexer_parser.parser"], runs)
+    with tempfile.TemporaryDirectory() as out_dir:
+        sample = os.path.join(out_dir, os.path.basename(SAMPLE))
+        with open(os.path.join(REPO_DIR, SAMPLE)) as src, open(sample, "w") as dst:
+            dst.write(src.read())
+        # --no-cache, the second run loads the parser tables and compiles instead of hitting the compile cache
+        bench("parhl_comp " + os.path.basename(SAMPLE), [sys.executable, "parhl_comp", "--no-cache", sample], runs)
+        bench("parhl_comp compile cache", [sys.executable, "parhl_comp", sample], runs, ("miss", "hit"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import shutil
+from .parser_tables import CACHE_DIR
+
+"""
+Cache of compiled programs keyed on the hash of the source, the compiler and the IR format.
+Entries are whole IR files, the least recently used ones are evicted once the cache outgrows its size cap.
+"""
+
+COMPILE_CACHE_DIR = os.path.join(CACHE_DIR, "compiled")
+# Maximum size of all the cached IR files
+MAX_CACHE_BYTES = int(os.environ.get("PARHL_COMPILE_CACHE_BYTES", 256 * 1024 * 1024))
+
+_COMPILER_DIR = os.path.dirname(os.path.abspath(__file__))
+_compiler_hash = None
+
+def compiler_hash():
+    """
+    Hash of the compiler sources, any change to the compiler invalidates the cache.
+    """
+    global _compiler_hash
+    if _compiler_hash is None:
+        sha = hashlib.sha256()
+        for root, dirs, files in os.walk(_COMPILER_DIR):
+            dirs[:] = sorted(d for d in dirs if d not in ("tests", "__pycache__"))
+            for file in sorted(f for f in files if f.endswith(".py")):
+                path = os.path.join(root, file)
+                sha.update(os.path.relpath(path, _COMPILER_DIR).encode())
+                with open(path, "rb") as src:
+                    sha.update(src.read())
+        _compiler_hash = sha.hexdigest()
+    return _compiler_hash
+
+def cache_key(source, ir_format):
+    sha = hashlib.sha256()
+    for part in (compiler_hash().encode(), ir_format.encode(), source):
+        sha.update(part)
+    return sha.hexdigest()
+
+def _entry(key):
+    return os.path.join(COMPILE_CACHE_DIR, key)
+
+def fetch(key, output_file):
+    """
+    Copies the cached IR to output_file, returns False on a miss.
+    """
+    entry = _entry(key)
+    try:
+        shutil.copyfile(entry, output_file)
+        os.utime(entry) # most recently used
+        return True
+    except OSError:
+        return False
+
+def store(key, output_file):
+    try:
+        os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+        tmp_entry = f"{_entry(key)}.{os.getpid()}.tmp"
+        shutil.copyfile(output_file, tmp_entry)
+        os.replace(tmp_entry, _entry(key))
+        evict()
+    except OSError:
+        pass # the cache is only an optimization
+
+def evict(max_bytes=None):
+    """
+    Removes the least recently used entries until the cache fits in max_bytes.
+    """
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    entries = []
+    with os.scandir(COMPILE_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
@@ -0,0 +1,30 @@
+from .tco import eliminate_tail_calls
+from .inline import inline_functions
+from .cse import eliminate_common_subexpressions
+from .peephole import peephole
+from .licm import hoist_invariants
+from .fusion import fuse_tensor_ops
+from .slot_reuse import reuse_slots
+
+"""
+Optimizer passes over the quadruples of a ParseContext, they run after code generation and before the IR is written.
+Every pass works in place and returns how much it saved.
+"""
+
+# (name, pass, what the number the pass returns counts), in the order they run
+PASSES = [
+    ("tco", eliminate_tail_calls, "tail calls turned into jumps"), # before inline, the funcs may no longer call
+    ("inline", inline_functions, "calls inlined"), # after tco, the passes after it then see the inlined bodies
+    ("cse", eliminate_common_subexpressions, "quads removed"),
+    ("peephole", peephole, "quads removed"),
+    ("licm", hoist_invariants, "quads moved out of loops"),
+    ("fusion", fuse_tensor_ops, "tensor ops fused into kernels"), # after licm, which moves single ops
+    ("slot_reuse", reuse_slots, "frame slots freed"), # last, the other passes can drop temps
+]
+
+def optimize(quads, func_dir, inline=False):
+    """
+    Runs every pass, inline only when inline is set. Returns {pass name : what it saved} of the passes run.
+    """
+    # inlining makes the program longer, it only runs when asked for
+    return {name: opt_pass(quads, func_dir) for name, opt_pass, _ in PASSES if name != "inline" or inline}
@@ -0,0 +1,98 @@
+from ..structs.quadruples import Quadruple
+from .quad_utils import (ARITH_OPS, INDEX_OPS, NO_WRITE_OPS, POINTER_SIZE, basic_blocks, is_tens_operand,
+    mem_dir_of, read_slots, remove_quads, rename_slots, slot, slots, temp_slots, tens_sizes, tens_temp_slots,
+    write_counts, written_slots)
+
+"""
+Common subexpression elimination, local value numbering over every basic block.
+An op on the same operands as an earlier op of the block, with none of them written in between, is removed
+and its result temp is replaced by the result of the earlier op. Repeated accesses like a[i][j] reuse the same
+pointer and repeated tensor ops like X ** W run once.
+"""
+
+# op_name of the ops whose operands can be swapped, not for strings where PLUS concatenates
+COMMUTATIVE_OPS = {"PLUS", "MULT", "EQ", "NOT_EQ", "AND", "OR"}
+STRING_TID = 0
+
+def _hashable(opd):
+    if isinstance(opd, (list, tuple)):
+        return tuple(_hashable(x) for x in opd)
+    return opd
+
+def _key(q: Quadruple):
+    """
+    What identifies the value q computes, INDEX and UNCHECKED_INDEX compute the same pointer.
+    """
+    op = "INDEX" if q.op in INDEX_OPS else q.op
+    args = [_hashable(q.arg_1), _hashable(q.arg_2)]
+    scalars = not any(is_tens_operand(arg) for arg in (q.arg_1, q.arg_2))
+    if op in COMMUTATIVE_OPS and scalars and q.arg_2 is not None and STRING_TID not in (q.arg_1[3], q.arg_2[3]):
+        args.sort()
+    return (op, *args, q.result[3])
+
+def _operand_mem_dirs(q: Quadruple):
+    if q.op in INDEX_OPS:
+        return list(q.arg_2)
+    return [mem_dir_of(opd) for opd in (q.arg_1, q.arg_2) if mem_dir_of(opd) is not None]
+
+class _Available():
+    """
+    Values computed in the current basic block: key : (result slots, slots read, reads through pointers, reads tensors)
+    """
+    def __init__(self):
+        self.values = {}
+
+    def add(self, q: Quadruple, result):
+        reads_pointers = any(mem_dir[2] for mem_dir in _operand_mem_dirs(q))
+        # the tensor operand of INDEX ops is only its address
+        reads_tens = q.op not in INDEX_OPS and any(is_tens_operand(opd) for opd in (q.arg_1, q.arg_2))
+        self.values[_key(q)] = (result, set(read_slots(q)), reads_pointers, reads_tens)
+
+    def kill(self, written, tens_written, pointer_written):
+        """
+        Drops the values which may have changed: the ones reading or stored in written slots, reading through
+        pointers when tensor memory changes and reading tensors when a pointer is written to.
+        """
+        self.values = {
+            key: value for key, value in self.values.items()
+            if written.isdisjoint(value[0]) and written.isdisjoint(value[1])
+                and not (value[2] and (tens_written or pointer_written))
+                and not (value[3] and pointer_written)
+        }
+
+def eliminate_common_subexpressions(quads: list[Quadruple], func_dir):
+    """
+    Returns the number of quads removed.
+    """
+    sizes = tens_sizes(func_dir)
+    tens_size = lambda mem_dir: sizes.get(slot(mem_dir), 1)
+    # the results of both ops must be temps nothing else writes, so the earlier one still holds the value
+    # wherever the removed one is read
+    temps, counts = temp_slots(func_dir) | tens_temp_slots(func_dir), write_counts(quads, tens_size)
+    tens_memory = {(fid, first + i, tid) for (fid, first, tid), size in sizes.items() for i in range(size)}
+    removed, new_slots = set(), {} # removed result slot : slot of the earlier result
+    for start, end in basic_blocks(quads):
+        available = _Available()
+        for i in range(start, end):
+            q = quads[i]
+            rename_slots([q], new_slots)
+            result = mem_dir_of(q.result)
+            if (q.op in ARITH_OPS or q.op in INDEX_OPS) and result is not None and not result[2]:
+                size = POINTER_SIZE if q.op in INDEX_OPS else tens_size(result)
+                result_slots = slots(result, size)
+                if all(s in temps and counts.get(s) == 1 for s in result_slots):
+                    earlier = available.values.get(_key(q))
+                    if earlier is not None and len(earlier[0]) == size:
+                        removed.add(i)
+                        new_slots |= dict(zip(result_slots, earlier[0]))
+                        continue
+                    written = set(written_slots(q, tens_size))
+                    available.kill(written, not written.isdisjoint(tens_memory), False)
+                    available.add(q, result_slots)
+                    continue
+            written = set(written_slots(q, tens_size))
+            pointer_written = q.op not in NO_WRITE_OPS and result is not None and bool(result[2])
+            if written or pointer_written:
+                available.kill(written, not written.isdisjoint(tens_memory), pointer_written)
+    rename_slots(quads, new_slots)
+    return remove_quads(quads, removed, func_dir)
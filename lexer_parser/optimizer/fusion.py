@@ -0,0 +1,93 @@
+from ..structs.quadruples import Quadruple
+from .quad_utils import (NO_WRITE_OPS, basic_blocks, is_tens_operand, mem_dir_of, read_counts, read_slots,
+    remove_quads, slot, slots, tens_sizes, tens_temp_slots, write_counts, written_slots)
+
+"""
+Fusion of element-wise tensor expressions, the ops of an expression like a + b * c - d become a single
+FUSED quad: (FUSED, [input operand], [(op_name, operand, operand or None, result type id)], result).
+The operands of a step index the inputs followed by the values of the steps before it, the last step is the
+result. The vm runs the steps with out= torch ops into the result, so the temps in between are neither
+allocated nor copied to the frame.
+An op is fused into the op reading its result when the result is a tensor temp only that op reads, both are
+in the same basic block and none of the inputs of the first op is written in between.
+"""
+
+# op_names of the element-wise tensor ops a kernel can run, tensor comparisons reduce to a single bool
+FUSABLE_BIN_OPS = {"PLUS", "MINUS", "MULT", "DIV", "MOD", "AND", "OR"}
+FUSABLE_UN_OPS = {"MINUS", "NOT"}
+STRING_TID = 0
+
+def _is_fusable(q: Quadruple, sizes):
+    if q.op not in (FUSABLE_UN_OPS if q.arg_2 is None else FUSABLE_BIN_OPS):
+        return False
+    opds = [q.arg_1] if q.arg_2 is None else [q.arg_1, q.arg_2]
+    # the type id of a pointer is not the type of what it points to
+    if not all(is_tens_operand(opd) and not opd[0][2] and opd[0][3] != STRING_TID for opd in opds):
+        return False
+    result = mem_dir_of(q.result)
+    return result is not None and not result[2] and slot(result) in sizes
+
+def _kernel(q: Quadruple):
+    """
+    FUSED quad of the single op q.
+    """
+    inputs = [q.arg_1] if q.arg_2 is None or q.arg_2 == q.arg_1 else [q.arg_1, q.arg_2]
+    right = None if q.arg_2 is None else inputs.index(q.arg_2)
+    return Quadruple("FUSED", inputs, [(q.op, 0, right, q.result[3])], q.result)
+
+def _merge(inner: Quadruple, outer: Quadruple, k):
+    """
+    FUSED quad of outer where its input k is the result of inner.
+    """
+    inner_inputs, inner_program, outer_inputs, outer_program = inner.arg_1, inner.arg_2, outer.arg_1, outer.arg_2
+    inputs = [opd for i, opd in enumerate(outer_inputs) if i != k]
+    inputs += [opd for opd in inner_inputs if opd not in inputs]
+    n_inner = len(inputs) + len(inner_program) # values before the first step of outer
+    def inner_ref(ref):
+        if ref is None or ref >= len(inner_inputs):
+            return ref if ref is None else len(inputs) + ref - len(inner_inputs)
+        return inputs.index(inner_inputs[ref])
+    def outer_ref(ref):
+        if ref is None or ref >= len(outer_inputs):
+            return ref if ref is None else n_inner + ref - len(outer_inputs)
+        return n_inner - 1 if ref == k else inputs.index(outer_inputs[ref])
+    program = [(op, inner_ref(l), inner_ref(r), tid) for op, l, r, tid in inner_program]
+    program += [(op, outer_ref(l), outer_ref(r), tid) for op, l, r, tid in outer_program]
+    return Quadruple("FUSED", inputs, program, outer.result)
+
+def fuse_tensor_ops(quads: list[Quadruple], func_dir):
+    """
+    Returns the number of ops fused into the kernel of another op.
+    """
+    sizes = tens_sizes(func_dir)
+    tens_size = lambda mem_dir: sizes.get(slot(mem_dir), 1)
+    temps, reads, writes = tens_temp_slots(func_dir), read_counts(quads), write_counts(quads, tens_size)
+    def is_single_use(mem_dir):
+        res_slots = slots(mem_dir, tens_size(mem_dir))
+        return all(s in temps and reads.get(s) == 1 and writes.get(s) == 1 for s in res_slots)
+    kernels, fused = {}, set() # index : FUSED quad of the op there, indexes of the ops fused into another
+    for start, end in basic_blocks(quads):
+        pending = {} # result of an op only a later op reads : its index
+        for i in range(start, end):
+            q = quads[i]
+            if _is_fusable(q, sizes):
+                kernel = _kernel(q)
+                while True:
+                    k = next((k for k, opd in enumerate(kernel.arg_1) if opd[0] in pending), None)
+                    if k is None:
+                        break
+                    inner = pending.pop(kernel.arg_1[k][0])
+                    kernel = _merge(kernels.pop(inner), kernel, k)
+                    fused.add(inner)
+                kernels[i] = kernel
+            written = set(written_slots(q, tens_size))
+            if q.op not in NO_WRITE_OPS and mem_dir_of(q.result) is not None and q.result[2]:
+                pending = {} # writes through a pointer may land in any input
+            elif written:
+                pending = {res: j for res, j in pending.items() if written.isdisjoint(read_slots(kernels[j]))}
+            if i in kernels and is_single_use(q.result):
+                pending[q.result] = i
+    for i, kernel in kernels.items():
+        if len(kernel.arg_2) > 1: # single ops run as they are
+            quads[i] = kernel
+    return remove_quads(quads, fused, func_dir)
@@ -0,0 +1,121 @@
+from ..structs.quadruples import Quadruple
+from ..structs.var_dir import Tensor
+from ..lexer import type_token_to_mem_id
+from .quad_utils import JUMP_OPS, all_blocks, func_end, map_mem_dirs, replace_quads, scopes, slot
+
+"""
+Function inlining, calls to small funcs which call no other func are replaced by a copy of the func body,
+so the call runs without ERA, PARAMs, GOSUB and a new frame.
+The vars and temps of the func get new temps of the block the call runs in, the PARAMs become ASSIGs to them
+and the RETURNs ASSIGs to the return var followed by a jump past the copy.
+A func whose calls were all inlined may be inlined next, recursive funcs never are.
+Funcs keep their own body, the calls which are not inlined still run it.
+"""
+
+# funcs longer than this (ENDFUNC included) are always called
+MAX_INLINE_QUADS = 30
+
+def _body(quads: list[Quadruple], func):
+    """
+    (first, end) indexes of the body of func, end is its last ENDFUNC. None when func can not be inlined.
+    """
+    first = func.q_index
+    end = func_end(quads, func)
+    if func.funcs or end - first + 1 > MAX_INLINE_QUADS:
+        return None
+    if any(q.op in ("ERA", "GOSUB") for q in quads[first:end]):
+        return None
+    return first, end
+
+def _calls(quads: list[Quadruple]):
+    """
+    Yields (ERA index, GOSUB index, func id) of every call, the PARAMs of a call are between both.
+    """
+    for i, q in enumerate(quads):
+        if q.op == "GOSUB":
+            era = i - 1
+            while quads[era].op == "PARAM":
+                era -= 1
+            yield era, i, q.result
+
+def _local_slots(func, func_dir, scope):
+    """
+    {slot of func : slot of a new temp of scope} for the vars, temps and tensors of func,
+    its constants and tensor literals stay where the vm loads them.
+    """
+    consts = {slot(var.mem_dir) for type_consts in func.consts.values() for var in type_consts.values()}
+    consts |= {slot(mem_dir) for type_consts in func.tens_consts.values() for _, mem_dir in type_consts}
+    tensors = {slot(var.mem_dir): var for var in [*func.vars.values(), *func.tens_temps] if isinstance(var, Tensor)}
+    new_slots = {}
+    for type, counter in (*func.cpu_var_counter.items(), *func.gpu_var_counter.items()):
+        tid = type_token_to_mem_id[type]
+        regions = dict(func.tens_regions.get(type, [])) # first var num : size
+        idx = 0
+        while idx < counter:
+            old, size = (func.id, idx, tid), regions.get(idx, 1)
+            if old not in consts:
+                if idx in regions:
+                    dims = [dim['n'] for dim in tensors[old].dims] if old in tensors else [size]
+                    new = func_dir.new_tens_temp(type, dims, scope).mem_dir
+                else:
+                    new = func_dir.new_temp(type, scope).mem_dir
+                for i in range(size):
+                    new_slots[(func.id, idx + i, tid)] = (new[0], new[1] + i, tid)
+            idx += size
+    return new_slots
+
+def _inlined(quads: list[Quadruple], era, gosub, body, new_slots):
+    """
+    The quads which replace quads[era:gosub+1], jumps already point to where the copy starts at era.
+    """
+    def remap(mem_dir):
+        if slot(mem_dir) not in new_slots:
+            return mem_dir
+        fid, idx, tid = new_slots[slot(mem_dir)]
+        return (fid, idx, mem_dir[2], tid)
+    copy = lambda op, *opds: Quadruple(op, *(map_mem_dirs(opd, remap) for opd in opds))
+    res = [copy("ASSIG", q.arg_1, None, q.result) for q in quads[era+1:gosub]]
+    first, end = body
+    new_index, exits, open_blocks = {}, [], []
+    for i in range(first, end + 1):
+        q = quads[i]
+        new_index[i] = len(res)
+        if q.op in ("RETURN", "ENDFUNC"):
+            if q.op == "RETURN":
+                res.append(copy("ASSIG", q.arg_1, None, q.result))
+            # the blocks the return leaves are closed just like the vm does on a return
+            res.extend(Quadruple("ENDBLK", result=block) for block in reversed(open_blocks))
+            if i < end - 1: # the last return goes on to the end of the copy
+                exits.append(len(res))
+                res.append(Quadruple("GOTO"))
+            continue
+        if q.op == "STRTBLK":
+            open_blocks.append(q.result)
+        elif q.op == "ENDBLK" and open_blocks and open_blocks[-1] == q.result: # not the ones after a return
+            open_blocks.pop()
+        res.append(copy(q.op, q.arg_1, q.arg_2, q.result))
+    new_index[end + 1] = len(res)
+    for q in res[gosub-era-1:]: # the jumps of the body, to its own quads
+        if q.op in JUMP_OPS and q.result is not None:
+            q.result = era + new_index[q.result]
+    for i in exits:
+        res[i].result = era + len(res)
+    return res
+
+def inline_functions(quads: list[Quadruple], func_dir):
+    """
+    Inlines calls until no call to a func which can be inlined is left, returns the number of calls inlined.
+    """
+    blocks = {block.id: block for block in all_blocks(func_dir)}
+    total = 0
+    while True:
+        for era, gosub, fid in _calls(quads):
+            body = _body(quads, blocks[fid])
+            if body is not None:
+                break
+        else:
+            return total
+        scope = blocks[scopes(quads, func_dir)[era]]
+        new_slots = _local_slots(blocks[fid], func_dir, scope)
+        replace_quads(quads, era, gosub + 1, _inlined(quads, era, gosub, body, new_slots), func_dir)
+        total += 1
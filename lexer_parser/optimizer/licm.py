@@ -0,0 +1,153 @@
+from ..structs.quadruples import Quadruple
+from .quad_utils import (ARITH_OPS, INDEX_OPS, MEM_ID_TO_TYPE, NO_WRITE_OPS, POINTER_SIZE, all_blocks, insert_quads,
+    is_tens_operand, mem_dir_of, read_positions, remove_quads, rename_slots, scopes, slot, slots, temp_slots,
+    tens_sizes, tens_temp_slots, write_counts, written_slots)
+
+"""
+Loop invariant code motion, computations of while and for loops whose operands do not change
+while the loop runs are moved right before the loop header, so they run once instead of on every iteration.
+Loops are found by their back edge: the GOTO at the end of the body which jumps back to the condition.
+The moved quads write new temps of the block open before the loop, the blocks of the body are only
+open while an iteration runs.
+"""
+
+# ops which compute their result from their operands only and never fail, running them once before
+# the loop (even if the loop body would not have run them) does not change what the program does
+# (a division by 0 gives inf or nan, an int modulo by 0 and an int power to a negative exponent fail)
+PURE_OPS = ARITH_OPS - {"MOD", "EXP"} | {"UNCHECKED_INDEX"}
+
+def _loops(quads: list[Quadruple]):
+    """
+    (header, back edge) index pairs of every loop, inner loops first.
+    Jumps back to the same header, like the ones tail calls leave, make one loop up to the last of them.
+    """
+    loops = {q.result: i for i, q in enumerate(quads) if q.op == "GOTO" and q.result <= i} # header : back edge
+    return sorted(loops.items(), key=lambda loop: loop[1] - loop[0])
+
+class _Program():
+    """
+    What the pass needs to know about the temps and constants of the program.
+    """
+    def __init__(self, quads: list[Quadruple], func_dir):
+        self.func_dir = func_dir
+        self.blocks = {block.id: block for block in all_blocks(func_dir)}
+        sizes = tens_sizes(func_dir)
+        self.tens_size = lambda mem_dir: sizes.get(slot(mem_dir), 1)
+        self.consts = {slot(var.mem_dir) for block in self.blocks.values()
+            for consts in block.consts.values() for var in consts.values()}
+        self.tens_temps = {} # slot of the first element : tensor temp
+        for block in self.blocks.values():
+            literals = {tuple(mem_dir) for type_consts in block.tens_consts.values() for _, mem_dir in type_consts}
+            for tens in block.tens_temps:
+                first = slot(tens.mem_dir)
+                if tuple(tens.mem_dir) in literals: # loaded once, nothing writes them
+                    self.consts |= set(slots(tens.mem_dir, sizes[first]))
+                else:
+                    self.tens_temps[first] = tens
+        self.temps = temp_slots(func_dir) | tens_temp_slots(func_dir)
+        self.write_counts = write_counts(quads, self.tens_size)
+
+    def result_slots(self, q: Quadruple):
+        """
+        Slots of the result of q when it is a temp nothing else writes, None otherwise.
+        """
+        mem_dir = mem_dir_of(q.result)
+        if mem_dir is None or mem_dir[2]:
+            return None
+        size = POINTER_SIZE if q.op in INDEX_OPS else self.tens_size(mem_dir)
+        res = slots(mem_dir, size)
+        if all(s in self.temps and self.write_counts.get(s) == 1 for s in res):
+            return res
+        return None
+
+    def new_temp(self, q: Quadruple, scope):
+        """
+        mem_dir of a new temp of scope which can hold the result of q.
+        """
+        fid, idx, _, tid = q.result
+        type, block = MEM_ID_TO_TYPE[tid], self.blocks[scope]
+        if q.op in INDEX_OPS:
+            return [self.func_dir.new_temp(type, block) for _ in range(POINTER_SIZE)][0].mem_dir
+        if (fid, idx, tid) in self.tens_temps:
+            dims = [dim['n'] for dim in self.tens_temps[(fid, idx, tid)].dims]
+            return self.func_dir.new_tens_temp(type, dims, block).mem_dir
+        return self.func_dir.new_temp(type, block).mem_dir
+
+class _Loop():
+    """
+    The slots a loop may change while it runs.
+    """
+    def __init__(self, quads: list[Quadruple], header, back_edge, program: _Program):
+        self.program = program
+        body = quads[header:back_edge+1]
+        # the frames of the blocks of the body do not exist before the loop
+        self.inner_blocks = {q.result for q in body if q.op == "STRTBLK"}
+        self.written = {s for q in body for s in written_slots(q, program.tens_size)}
+        # writes through pointers may land in any tensor of their type
+        self.pointer_tids = {q.result[3] for q in body
+            if q.op not in NO_WRITE_OPS and mem_dir_of(q.result) is not None and q.result[2]}
+        # called funcs may write global vars and tensors, only temps are safe from them
+        self.has_calls = any(q.op == "GOSUB" for q in body)
+        self.hoisted = set() # result slots of the quads moved out of the loop
+
+    def is_invariant(self, opd):
+        mem_dir = mem_dir_of(opd)
+        if mem_dir is None:
+            return True
+        if mem_dir[2]: # what a pointer points to may change
+            return False
+        opd_slots = slots(mem_dir, self.program.tens_size(mem_dir) if is_tens_operand(opd) else 1)
+        if all(s in self.program.consts or s in self.hoisted for s in opd_slots):
+            return True
+        if mem_dir[0] in self.inner_blocks or any(s in self.written for s in opd_slots):
+            return False
+        if is_tens_operand(opd) and mem_dir[3] in self.pointer_tids:
+            return False
+        return not self.has_calls or all(s in self.program.temps for s in opd_slots)
+
+    def can_hoist(self, q: Quadruple):
+        if q.op not in PURE_OPS:
+            return False
+        opds = q.arg_2 if q.op in INDEX_OPS else [getattr(q, pos) for pos in read_positions(q)]
+        return all(self.is_invariant(opd) for opd in opds)
+
+def _hoist(quads: list[Quadruple], program: _Program, header, back_edge, scope):
+    """
+    Moves the invariant quads of the loop right before its header, returns how many were moved.
+    """
+    func_dir = program.func_dir
+    loop = _Loop(quads, header, back_edge, program)
+    hoisted, new_slots = [], {} # old slot : new slot
+    for i in range(header, back_edge):
+        q = quads[i]
+        result = program.result_slots(q)
+        if result is None or not loop.can_hoist(q):
+            continue
+        hoisted.append(i)
+        loop.hoisted |= set(result)
+        fid, idx, _, tid = program.new_temp(q, scope)
+        for offset, s in enumerate(result):
+            new_slots[s] = (fid, idx + offset, tid)
+    if not hoisted:
+        return 0
+    rename_slots(quads, new_slots)
+    moved = [quads[i] for i in hoisted]
+    remove_quads(quads, set(hoisted), func_dir)
+    insert_quads(quads, header, moved, func_dir, (header, back_edge - len(hoisted)))
+    return len(hoisted)
+
+def hoist_invariants(quads: list[Quadruple], func_dir):
+    """
+    Runs until no loop has invariant quads left, quads moved out of an inner loop may move again out of
+    the loops around it. Returns the number of quads moved.
+    """
+    total = 0
+    while True:
+        scope_of, program = scopes(quads, func_dir), _Program(quads, func_dir)
+        for header, back_edge in _loops(quads):
+            n_hoisted = _hoist(quads, program, header, back_edge, scope_of[header])
+            if n_hoisted:
+                total += n_hoisted
+                break
+        else:
+            return total
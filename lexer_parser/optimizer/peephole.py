@@ -0,0 +1,109 @@
+from ..structs.quadruples import Quadruple
+from .quad_utils import (NO_WRITE_OPS, SIDE_EFFECT_OPS, basic_blocks, block_leaders, is_mem_dirs_operand,
+    is_tens_operand, mem_dir_of, read_counts, read_positions, read_slots, remove_quads, slot, temp_slots, written_slots)
+
+"""
+Peephole / copy propagation pass, removes the copies through temps the code generation leaves behind:
+- the copy of a function return var into a temp after every GOSUB
+- the initialization of the offset temp of tensor accesses and the copy of the base address overwritten next
+- expression -> temp -> ASSIG -> var on assignments and declarations
+"""
+
+def _is_scalar_mem_dir(opd):
+    return mem_dir_of(opd) is not None and not is_tens_operand(opd)
+
+def _is_temp_copy(q: Quadruple, temps):
+    # ASSIG src -> temp where reading src in place of temp is the same
+    if q.op != "ASSIG" or not _is_scalar_mem_dir(q.arg_1):
+        return False
+    src, dst = q.arg_1, q.result
+    return (not src[2] and not dst[2] and slot(dst) in temps
+        and src[3] == dst[3] and slot(src) != slot(dst))
+
+def _substitute(opd, copies):
+    if is_mem_dirs_operand(opd):
+        return [_substitute(x, copies) for x in opd]
+    mem_dir = mem_dir_of(opd)
+    if mem_dir is None or mem_dir[2] or slot(mem_dir) not in copies:
+        return opd
+    if is_tens_operand(opd):
+        return (copies[slot(mem_dir)], opd[1])
+    return copies[slot(mem_dir)]
+
+def propagate_copies(quads: list[Quadruple], temps):
+    """
+    Inside every basic block, reads of a temp which holds a copy are replaced by reads of the copied value.
+    """
+    for start, end in basic_blocks(quads):
+        copies = {} # temp slot : copied mem_dir
+        for q in quads[start:end]:
+            if copies and q.op != "COPY": # COPY reads a range, it can not be redirected
+                for pos in read_positions(q):
+                    setattr(q, pos, _substitute(getattr(q, pos), copies))
+            written = set(written_slots(q))
+            if written:
+                copies = {t: src for t, src in copies.items() if t not in written and slot(src) not in written}
+            if _is_temp_copy(q, temps):
+                copies[slot(q.result)] = q.arg_1
+
+def dead_stores(quads: list[Quadruple], temps):
+    """
+    Indexes of the ASSIGs whose value is never read: self assigns, assigns to temps never read and
+    assigns to temps overwritten in the same basic block before being read.
+    """
+    counts, dead = read_counts(quads), set()
+    for start, end in basic_blocks(quads):
+        pending = {} # temp slot : index of its last ASSIG not read yet
+        for i in range(start, end):
+            q = quads[i]
+            for s in read_slots(q):
+                pending.pop(s, None)
+            for s in written_slots(q):
+                if s in pending:
+                    dead.add(pending.pop(s))
+            if q.op != "ASSIG" or q.result[2]:
+                continue
+            if q.arg_1 == q.result:
+                dead.add(i)
+            elif slot(q.result) in temps and not is_tens_operand(q.arg_1):
+                if counts.get(slot(q.result), 0) == 0:
+                    dead.add(i)
+                else:
+                    pending[slot(q.result)] = i
+    return dead
+
+def _writes_only_result(q: Quadruple):
+    # scalar ops whose result operand can be pointed somewhere else
+    if q.op in SIDE_EFFECT_OPS - {"READ_LINE", "READ_FILE"} or q.op == "COPY":
+        return False
+    return not any(is_tens_operand(getattr(q, pos)) for pos in ("arg_1", "arg_2", "result"))
+
+def folded_assigs(quads: list[Quadruple], temps):
+    """
+    Makes "op -> temp; ASSIG temp -> var" write the var directly, returns the indexes of the ASSIGs left unused.
+    """
+    counts, leaders, folded = read_counts(quads), block_leaders(quads), set()
+    for i in range(1, len(quads)):
+        q, prev = quads[i], quads[i-1]
+        if q.op != "ASSIG" or i in leaders or i-1 in folded or not _is_scalar_mem_dir(q.arg_1):
+            continue
+        src, dst = q.arg_1, q.result
+        if (src[2] or dst[2] or slot(src) not in temps or counts.get(slot(src), 0) != 1
+            or src[3] != dst[3] or prev.result != src or not _writes_only_result(prev)):
+            continue
+        prev.result = dst
+        folded.add(i)
+    return folded
+
+def peephole(quads: list[Quadruple], func_dir):
+    """
+    Runs the pass until nothing changes, returns the number of quads removed.
+    """
+    temps, total = temp_slots(func_dir), 0
+    while True:
+        propagate_copies(quads, temps)
+        n_removed = remove_quads(quads, dead_stores(quads, temps), func_dir)
+        n_removed += remove_quads(quads, folded_assigs(quads, temps), func_dir)
+        if not n_removed:
+            return total
+        total += n_removed
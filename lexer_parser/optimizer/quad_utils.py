@@ -0,0 +1,325 @@
+from ..structs.quadruples import Quadruple
+from ..lexer import type_token_to_mem_id
+
+"""
+Helpers shared by the optimizer passes: which operands of a quad are read or written,
+basic blocks and removing quads while keeping jump targets right.
+
+A slot is a (func id, var num, type) triple, the memory a non pointer mem_dir refers to.
+"""
+
+JUMP_OPS = {"GOTO", "GOTOF"}
+# ops after which the vm changes the pc or the frames, they end a basic block
+BLOCK_END_OPS = {"GOTO", "GOTOF", "GOSUB", "RETURN", "ENDFUNC", "STRTBLK", "ENDBLK"}
+# ops which write nothing in the result operand, the rest write a value to it
+NO_WRITE_OPS = {"PRINT", "VERIFY", "WRITE_FILE", "GOTO", "GOTOF", "GOSUB", "ERA", "STRTBLK", "ENDBLK", "ENDFUNC"}
+# ops which write the 4 slots of a pointer to a tensor element
+INDEX_OPS = {"INDEX", "UNCHECKED_INDEX"}
+# ops whose result only depends on their operands, on scalars and tensors
+ARITH_OPS = {"PLUS", "MINUS", "MULT", "DIV", "MOD", "EXP", "MMULT", "EQ", "NOT_EQ", "GEQT", "LEQT", "GT", "LT",
+    "AND", "OR", "NOT"}
+# ops with a side effect besides writing their result
+SIDE_EFFECT_OPS = {"PARAM", "RETURN", "READ_LINE", "READ_FILE"} | INDEX_OPS | NO_WRITE_OPS
+# pointers are 4 consecutive INT slots: func id, var num, dereference, type
+POINTER_SIZE = 4
+MEM_ID_TO_TYPE = {tid: type for type, tid in type_token_to_mem_id.items()}
+
+def is_tens_operand(opd):
+    # tensor operands are (mem_dir, dims)
+    return isinstance(opd, tuple) and len(opd) == 2 and isinstance(opd[0], tuple)
+
+def is_mem_dirs_operand(opd):
+    # INDEX ops take a list of index operands
+    return isinstance(opd, list) and len(opd) > 0 and all(mem_dir_of(x) is not None for x in opd)
+
+def mem_dir_of(opd):
+    """
+    The mem_dir of a scalar or tensor operand, None for anything else (dims, indexes, func ids).
+    mem_dirs are tuples in the quads the compiler builds, dims are lists.
+    """
+    if is_tens_operand(opd):
+        return opd[0]
+    if isinstance(opd, tuple) and len(opd) == 4 and all(isinstance(x, int) for x in opd):
+        return opd
+    return None
+
+def map_mem_dirs(opd, fn):
+    """
+    opd with fn applied to every mem_dir in it.
+    """
+    if is_mem_dirs_operand(opd):
+        return [map_mem_dirs(x, fn) for x in opd]
+    mem_dir = mem_dir_of(opd)
+    if mem_dir is None:
+        return opd
+    return (fn(mem_dir), opd[1]) if is_tens_operand(opd) else fn(mem_dir)
+
+def slot(mem_dir):
+    fid, idx, _, tid = mem_dir
+    return (fid, idx, tid)
+
+def slots(mem_dir, size=1):
+    fid, idx, deref, tid = mem_dir
+    if deref: # the pointer is read, what it points to is a tensor element
+        size = POINTER_SIZE
+    return [(fid, idx + i, tid) for i in range(size)]
+
+def read_positions(q: Quadruple):
+    """
+    Names of the operands of q which are read.
+    """
+    op = q.op
+    if op in ("PRINT",):
+        return ("result",)
+    if op in ("VERIFY", "WRITE_FILE"):
+        return ("arg_1", "result")
+    if op == "READ_FILE" or op in INDEX_OPS:
+        return ("arg_2",)
+    if op == "FUSED": # arg_2 is the program of the kernel
+        return ("arg_1",)
+    if op in ("READ_LINE", "GOTO", "GOSUB", "ERA", "STRTBLK", "ENDBLK", "ENDFUNC"):
+        return ()
+    if op in ("GOTOF", "ASSIG", "COPY", "PARAM", "RETURN"):
+        return ("arg_1",)
+    return ("arg_1", "arg_2") if q.arg_2 is not None else ("arg_1",)
+
+def _n_elems(dims):
+    n = 1
+    for dim in dims or []:
+        n *= dim
+    return n
+
+def read_slots(q: Quadruple):
+    if q.op in INDEX_OPS: # reads the indexes, the tensor operand is just its address
+        return [s for mem_dir in q.arg_2 for s in slots(mem_dir)]
+    if q.op == "FUSED": # reads every input of the kernel
+        return [s for mem_dir, dims in q.arg_1 for s in slots(mem_dir, _n_elems(dims))]
+    res = []
+    for pos in read_positions(q):
+        opd = getattr(q, pos)
+        mem_dir = mem_dir_of(opd)
+        if mem_dir is None:
+            continue
+        if is_tens_operand(opd):
+            size = _n_elems(opd[1])
+        elif q.op == "COPY":
+            size = q.arg_2
+        elif q.op == "WRITE_FILE" and pos == "arg_1":
+            size = _n_elems(q.arg_2)
+        else:
+            size = 1
+        res.extend(slots(mem_dir, size))
+    # writing through a pointer reads the pointer
+    if q.op not in NO_WRITE_OPS and q.result[2]:
+        res.extend(slots(q.result))
+    return res
+
+def written_slots(q: Quadruple, tens_size=None):
+    """
+    Slots written by q, writes through pointers land in tensors so they are not returned.
+    tens_size(mem_dir) gives the size of the tensor at mem_dir (1 for scalars), without it
+    only the first slot of tensor results is returned.
+    """
+    if q.op in NO_WRITE_OPS:
+        return []
+    mem_dir = mem_dir_of(q.result)
+    if mem_dir is None or mem_dir[2]:
+        return []
+    if q.op == "COPY":
+        size = q.arg_2
+    elif q.op in INDEX_OPS:
+        size = POINTER_SIZE
+    elif q.op in ("ASSIG", "PARAM", "RETURN") or tens_size is None:
+        size = 1
+    else:
+        size = tens_size(mem_dir)
+    return slots(mem_dir, size)
+
+def jump_target_positions(q: Quadruple):
+    if q.op in JUMP_OPS:
+        return ("result",)
+    if q.op == "GOSUB":
+        return ("arg_1",)
+    return ()
+
+def block_leaders(quads: list[Quadruple]):
+    """
+    Indexes of the first quad of every basic block.
+    """
+    leaders = {0}
+    for i, q in enumerate(quads):
+        for pos in jump_target_positions(q):
+            leaders.add(getattr(q, pos))
+        if q.op in BLOCK_END_OPS:
+            leaders.add(i + 1)
+    return leaders
+
+def basic_blocks(quads: list[Quadruple]):
+    """
+    Yields (start, end) for every basic block, end is exclusive.
+    """
+    leaders = sorted(l for l in block_leaders(quads) if l < len(quads))
+    for start, end in zip(leaders, leaders[1:] + [len(quads)]):
+        yield start, end
+
+def read_counts(quads: list[Quadruple]):
+    counts = {}
+    for q in quads:
+        for s in read_slots(q):
+            counts[s] = counts.get(s, 0) + 1
+    return counts
+
+def all_blocks(func_dir):
+    """
+    Yields every block and func of the program, starting by the global func.
+    """
+    stack = [func_dir.glob_func]
+    while stack:
+        block = stack.pop()
+        yield block
+        stack.extend(list(block.funcs.values()) + block.blocks)
+
+def tens_sizes(func_dir):
+    """
+    {slot of the first element : size} of every tensor.
+    """
+    sizes = {}
+    for block in all_blocks(func_dir):
+        for type, regions in block.tens_regions.items():
+            for first, size in regions:
+                sizes[(block.id, first, type_token_to_mem_id[type])] = size
+    return sizes
+
+def tens_temp_slots(func_dir):
+    """
+    Slots of every element of the tensor temps of the program, tensor literals are not temps.
+    """
+    res = set()
+    for block in all_blocks(func_dir):
+        literals = {tuple(mem_dir) for type_consts in block.tens_consts.values() for _, mem_dir in type_consts}
+        for tens in block.tens_temps:
+            if tuple(tens.mem_dir) not in literals:
+                size = 1
+                for dim in tens.dims:
+                    size *= dim['n']
+                res |= set(slots(tens.mem_dir, size))
+    return res
+
+def write_counts(quads: list[Quadruple], tens_size=None):
+    counts = {}
+    for q in quads:
+        for s in written_slots(q, tens_size):
+            counts[s] = counts.get(s, 0) + 1
+    return counts
+
+def rename_slots(quads: list[Quadruple], new_slots):
+    """
+    Makes every operand of the quads refer to new_slots[slot] instead of slot, both are slots.
+    """
+    def rename(mem_dir):
+        if slot(mem_dir) not in new_slots:
+            return mem_dir
+        fid, idx, tid = new_slots[slot(mem_dir)]
+        return (fid, idx, mem_dir[2], tid)
+    for q in quads:
+        q.arg_1, q.arg_2, q.result = (map_mem_dirs(opd, rename) for opd in (q.arg_1, q.arg_2, q.result))
+
+def temp_slots(func_dir):
+    """
+    Slots of the scalar temps of the program, constants and function return vars are not temps.
+    """
+    res, stack = set(), [func_dir.glob_func]
+    while stack:
+        block = stack.pop()
+        not_temps = {slot(var.mem_dir) for consts in block.consts.values() for var in consts.values()}
+        not_temps |= {slot(func.func_var.mem_dir) for func in block.funcs.values() if func.func_var}
+        res |= {slot(var.mem_dir) for var in block.temps.values()} - not_temps
+        stack.extend(list(block.funcs.values()) + block.blocks)
+    return res
+
+def remove_quads(quads: list[Quadruple], removed: set[int], func_dir=None):
+    """
+    Removes the quads at the removed indexes in place. Jumps to a removed quad go to the next one kept.
+    When func_dir is given the start index of its funcs is also updated.
+    """
+    if not removed:
+        return 0
+    new_index, n_removed = [], 0
+    for i in range(len(quads) + 1):
+        new_index.append(i - n_removed)
+        n_removed += i in removed
+    quads[:] = [q for i, q in enumerate(quads) if i not in removed]
+    for q in quads:
+        for pos in jump_target_positions(q):
+            setattr(q, pos, new_index[getattr(q, pos)])
+    if func_dir is not None:
+        stack = [func_dir.glob_func]
+        while stack:
+            block = stack.pop()
+            if hasattr(block, "q_index"):
+                block.q_index = new_index[block.q_index]
+            stack.extend(list(block.funcs.values()) + block.blocks)
+    return len(removed)
+
+def replace_quads(quads: list[Quadruple], start, end, new_quads: list[Quadruple], func_dir=None):
+    """
+    Replaces quads[start:end] by new_quads in place, the jumps of new_quads are already right.
+    Jumps into the replaced quads run new_quads from their start, jumps after them move with the quads.
+    """
+    delta = len(new_quads) - (end - start)
+    for q in quads[:start] + quads[end:]:
+        for pos in jump_target_positions(q):
+            target = getattr(q, pos)
+            if target >= end:
+                setattr(q, pos, target + delta)
+            elif target > start:
+                setattr(q, pos, start)
+    quads[start:end] = new_quads
+    if func_dir is not None:
+        for block in all_blocks(func_dir):
+            if hasattr(block, "q_index") and block.q_index >= end:
+                block.q_index += delta
+
+def func_end(quads: list[Quadruple], func):
+    """
+    Index of the last ENDFUNC of func, the GOTO right before a func skips it.
+    """
+    return quads[func.q_index - 1].result - 1
+
+def scopes(quads: list[Quadruple], func_dir):
+    """
+    Id of the innermost block open when every quad runs.
+    """
+    funcs = [block for block in all_blocks(func_dir) if hasattr(block, "q_index") and block is not func_dir.glob_func]
+    starts = {func.q_index: func.id for func in funcs}
+    ends = {func_end(quads, func) for func in funcs} # not every ENDFUNC, void returns are ENDFUNCs too
+    stack, res = [func_dir.glob_func.id], []
+    for i, q in enumerate(quads):
+        if i in starts:
+            stack.append(starts[i])
+        res.append(stack[-1])
+        if q.op == "STRTBLK":
+            stack.append(q.result)
+        elif i in ends:
+            stack.pop()
+        elif q.op == "ENDBLK" and stack[-1] == q.result: # not the ENDBLKs after a return, they never run
+            stack.pop()
+    return res
+
+def insert_quads(quads: list[Quadruple], position, new_quads: list[Quadruple], func_dir=None, loop=None):
+    """
+    Inserts new_quads before quads[position] in place. Jumps to position run the inserted quads first,
+    except the GOTO/GOTOFs inside the (start, end) loop, which keep going to the quad at position.
+    """
+    n = len(new_quads)
+    for i, q in enumerate(quads):
+        for pos in jump_target_positions(q):
+            target = getattr(q, pos)
+            from_loop = loop is not None and q.op in JUMP_OPS and loop[0] <= i <= loop[1]
+            if target > position or (target == position and from_loop):
+                setattr(q, pos, target + n)
+    quads[position:position] = new_quads
+    if func_dir is not None:
+        for block in all_blocks(func_dir):
+            if hasattr(block, "q_index") and block.q_index > position:
+                block.q_index += n
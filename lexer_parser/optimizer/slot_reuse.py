@@ -0,0 +1,223 @@
+from ..structs.quadruples import Quadruple
+from ..lexer import type_token_to_mem_id
+from .quad_utils import (INDEX_OPS, POINTER_SIZE, all_blocks, basic_blocks, is_mem_dirs_operand, map_mem_dirs,
+    mem_dir_of, read_slots, slot, tens_sizes, written_slots)
+
+"""
+Temp slot reuse, a register allocation over the memory of every frame.
+Code generation gives every temp its own slot, here the liveness of the temps is computed over the quads
+and temps which are never live at the same time share slots, which makes the frames smaller.
+Vars, constants, return vars and named tensors keep their slots.
+"""
+
+SCALAR, TENS = range(2)
+
+class _Unit():
+    """
+    Temp slots which move together: a scalar temp, the 4 temps of a pointer built by an Access or a tensor temp.
+    """
+    def __init__(self, fid, tid, first, size, kind, vars):
+        self.fid = fid
+        self.tid = tid
+        self.first = first
+        self.size = size
+        self.kind = kind
+        self.vars = vars # Vars whose mem_dir is in the unit
+        self.start = None # index of the first quad using the unit
+        self.position = first
+        self.interferes: set[_Unit] = set()
+
+def _pointer_mem_dirs(quads: list[Quadruple]):
+    for q in quads:
+        if q.op in INDEX_OPS:
+            yield q.result
+        for opd in (q.arg_1, q.result, *(q.arg_2 if is_mem_dirs_operand(q.arg_2) else [q.arg_2])):
+            mem_dir = mem_dir_of(opd)
+            if mem_dir is not None and mem_dir[2]:
+                yield mem_dir
+
+def _units(quads: list[Quadruple], func_dir):
+    """
+    Returns {slot : unit} for every temp slot which can move.
+    """
+    unit_of = {}
+    for block in all_blocks(func_dir):
+        not_temps = {slot(var.mem_dir) for consts in block.consts.values() for var in consts.values()}
+        not_temps |= {slot(func.func_var.mem_dir) for func in block.funcs.values() if func.func_var}
+        for var in block.temps.values():
+            if slot(var.mem_dir) not in not_temps:
+                fid, idx, _, tid = var.mem_dir
+                unit_of[slot(var.mem_dir)] = _Unit(fid, tid, idx, 1, SCALAR, [var])
+        literals = {tuple(mem_dir) for type_consts in block.tens_consts.values() for _, mem_dir in type_consts}
+        for tens in block.tens_temps:
+            if tuple(tens.mem_dir) in literals:
+                continue
+            fid, idx, _, tid = tens.mem_dir
+            size = 1
+            for dim in tens.dims:
+                size *= dim['n']
+            unit = _Unit(fid, tid, idx, size, TENS, [tens])
+            for i in range(size):
+                unit_of[(fid, idx + i, tid)] = unit
+    # the 4 temps of a pointer must stay consecutive
+    for mem_dir in set(_pointer_mem_dirs(quads)):
+        fid, idx, _, tid = mem_dir
+        pointer_slots = [(fid, idx + i, tid) for i in range(POINTER_SIZE)]
+        units = [unit_of.get(s) for s in pointer_slots]
+        if units[0] is not None and units[0].size == POINTER_SIZE and units[0].first == idx:
+            continue # already grouped
+        if any(unit is None or unit.kind != SCALAR or unit.size != 1 for unit in units):
+            for s in pointer_slots: # not temps, the pointer stays where it is
+                unit_of.pop(s, None)
+            continue
+        unit = _Unit(fid, tid, idx, POINTER_SIZE, SCALAR, [var for u in units for var in u.vars])
+        for s in pointer_slots:
+            unit_of[s] = unit
+    return unit_of
+
+def _successors(quads: list[Quadruple], blocks, block_of):
+    succs = []
+    for _, end in blocks:
+        q = quads[end - 1]
+        if q.op == "GOTO":
+            targets = [q.result]
+        elif q.op == "GOTOF":
+            targets = [end, q.result]
+        elif q.op in ("RETURN", "ENDFUNC"):
+            targets = []
+        else: # a GOSUB comes back to the next quad, the callee does not touch the caller's frame
+            targets = [end]
+        succs.append([block_of[t] for t in targets if t < len(quads)])
+    return succs
+
+def _interference(quads: list[Quadruple], unit_of, sizes):
+    """
+    Backward liveness of the temp slots, two units interfere when one is written while the other is live.
+    """
+    tens_size = lambda mem_dir: sizes.get(slot(mem_dir), 1)
+    reads = [[s for s in read_slots(q) if s in unit_of] for q in quads]
+    writes = [[s for s in written_slots(q, tens_size) if s in unit_of] for q in quads]
+    for i in range(len(quads)):
+        for s in reads[i] + writes[i]:
+            if unit_of[s].start is None:
+                unit_of[s].start = i
+    blocks = list(basic_blocks(quads))
+    block_of = {start: b for b, (start, _) in enumerate(blocks)}
+    succs = _successors(quads, blocks, block_of)
+    live_in = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for b in reversed(range(len(blocks))):
+            live = set().union(*(live_in[s] for s in succs[b]))
+            for i in range(blocks[b][1] - 1, blocks[b][0] - 1, -1):
+                live.difference_update(writes[i])
+                live.update(reads[i])
+            if live != live_in[b]:
+                live_in[b], changed = live, True
+    for b, (start, end) in enumerate(blocks):
+        live = set().union(*(live_in[s] for s in succs[b]))
+        for i in range(end - 1, start - 1, -1):
+            written = {unit_of[s] for s in writes[i]}
+            others = {unit_of[s] for s in live}
+            # tensor and pointer results must not overlap their own operands, 1 element tensors included
+            if any(unit.size > 1 or unit.kind == TENS for unit in written):
+                others |= {unit_of[s] for s in reads[i]}
+            for unit in written:
+                for other in others:
+                    if other is not unit:
+                        unit.interferes.add(other)
+                        other.interferes.add(unit)
+            live.difference_update(writes[i])
+            live.update(reads[i])
+
+def _place(units, fixed):
+    """
+    Gives every unit the lowest position where it does not overlap fixed slots, units of the other kind
+    (tensors and scalars of a type live in different segments of the vm) or units it interferes with.
+    """
+    placed, kinds = {}, {} # position : units there, position : kind of the units there
+    for unit in sorted(units, key=lambda u: (u.start is None, u.start or 0)):
+        position = 0
+        while not all(
+            pos not in fixed and kinds.get(pos, unit.kind) == unit.kind
+            and unit.interferes.isdisjoint(placed.get(pos, ()))
+            for pos in range(position, position + unit.size)
+        ):
+            position += 1
+        unit.position = position
+        for pos in range(position, position + unit.size):
+            placed.setdefault(pos, set()).add(unit)
+            kinds[pos] = unit.kind
+    return max(placed, default=-1) + 1
+
+def _remap(opd, new_slots):
+    def remap(mem_dir):
+        if slot(mem_dir) not in new_slots:
+            return mem_dir
+        fid, _, deref, tid = mem_dir
+        return (fid, new_slots[slot(mem_dir)], deref, tid)
+    return map_mem_dirs(opd, remap)
+
+def _move(var, position, new_slots, size=1):
+    fid, idx, deref, tid = var.mem_dir
+    for i in range(size):
+        new_slots[(fid, idx + i, tid)] = position + i
+    var.mem_dir = (fid, position, deref, tid)
+
+def reuse_slots(quads: list[Quadruple], func_dir):
+    """
+    Returns the number of slots the frames shrank by.
+    Constants and tensor literals are also moved after the last slot of the frame, the vm keeps them
+    outside of frames so the frames no longer reserve slots for them.
+    """
+    unit_of = _units(quads, func_dir)
+    sizes = tens_sizes(func_dir)
+    _interference(quads, unit_of, sizes)
+    units = {}
+    for unit in unit_of.values():
+        units.setdefault((unit.fid, unit.tid), {})[id(unit)] = unit
+    saved, new_slots = 0, {}
+    for block in all_blocks(func_dir):
+        for type, counters in (*((t, block.cpu_var_counter) for t in block.cpu_var_counter),
+                               *((t, block.gpu_var_counter) for t in block.gpu_var_counter)):
+            tid = type_token_to_mem_id[type]
+            type_units = list(units.get((block.id, tid), {}).values())
+            consts = list(block.consts.get(type, {}).values())
+            literals = {tuple(literal[1]): literal for literal in block.tens_consts.get(type, [])} # mem_dir : literal
+            literal_vars = [tens for tens in block.tens_temps if tuple(tens.mem_dir) in literals]
+            movable = {unit.first + i for unit in type_units for i in range(unit.size)}
+            movable |= {const.mem_dir[1] for const in consts}
+            movable |= {tens.mem_dir[1] + i for tens in literal_vars for i in range(sizes[slot(tens.mem_dir)])}
+            fixed = set(range(counters[type])) - movable
+            size = max(_place(type_units, fixed), max(fixed, default=-1) + 1)
+            saved += counters[type] - size
+            counters[type] = size
+            # tensor temps regions follow their temps
+            moved = {(unit.first, unit.size) for unit in type_units if unit.kind == TENS}
+            moved |= {(tens.mem_dir[1], sizes[slot(tens.mem_dir)]) for tens in literal_vars}
+            regions = [region for region in block.tens_regions.get(type, []) if tuple(region) not in moved]
+            for unit in type_units:
+                if unit.kind == TENS and [unit.position, unit.size] not in regions:
+                    regions.append([unit.position, unit.size])
+            # constants go after the frame
+            position = size
+            for tens in literal_vars:
+                literal, tens_size = literals[tuple(tens.mem_dir)], sizes[slot(tens.mem_dir)]
+                _move(tens, position, new_slots, tens_size)
+                literal[1] = tens.mem_dir
+                regions.append([position, tens_size])
+                position += tens_size
+            for const in consts:
+                _move(const, position, new_slots)
+                position += 1
+            if regions:
+                block.tens_regions[type] = regions
+    new_slots |= {s: unit.position + s[1] - unit.first for s, unit in unit_of.items()}
+    for q in quads:
+        q.arg_1, q.arg_2, q.result = (_remap(opd, new_slots) for opd in (q.arg_1, q.arg_2, q.result))
+    for unit in {id(unit): unit for unit in unit_of.values()}.values():
+        for var in unit.vars:
+            fid, idx, deref, tid = var.mem_dir
+            var.mem_dir = (fid, unit.position + idx - unit.first, deref, tid)
+    return saved
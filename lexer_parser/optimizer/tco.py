@@ -0,0 +1,80 @@
+from ..structs.quadruples import Quadruple
+from .quad_utils import MEM_ID_TO_TYPE, all_blocks, func_end, replace_quads, slot
+
+"""
+Tail call optimization, a func which returns the value of a call to itself, or calls itself right before
+its end, does not need a new frame for the call. The ERA, PARAMs and GOSUB become ASSIGs of the arguments
+to the params of the current frame and a jump back to the start of the func, so tail recursive funcs
+run in constant memory.
+"""
+
+def _funcs(quads: list[Quadruple], func_dir):
+    """
+    [(first, end, func)] of every func, inner funcs first.
+    """
+    funcs = [(block.q_index, func_end(quads, block), block) for block in all_blocks(func_dir)
+        if hasattr(block, "q_index") and block is not func_dir.glob_func]
+    return sorted(funcs, key=lambda func: func[1] - func[0])
+
+def _is_tail_call(quads: list[Quadruple], gosub, func):
+    """
+    If nothing but returning (the value of) the call at gosub is left to do.
+    """
+    nxt = quads[gosub + 1]
+    if func.func_var is None: # the blocks of the call may end first
+        i = gosub + 1
+        while quads[i].op == "ENDBLK" or (quads[i].op == "GOTO" and quads[i].result > i):
+            i = i + 1 if quads[i].op == "ENDBLK" else quads[i].result
+        return quads[i].op == "ENDFUNC"
+    ret = quads[gosub + 2] if gosub + 2 < len(quads) else None
+    return (nxt.op == "ASSIG" and nxt.arg_1 == func.func_var.mem_dir and ret is not None and ret.op == "RETURN"
+        and ret.arg_1 == nxt.result)
+
+def _open_blocks(quads: list[Quadruple], first, end):
+    blocks = []
+    for q in quads[first:end]:
+        if q.op == "STRTBLK":
+            blocks.append(q.result)
+        elif q.op == "ENDBLK" and blocks and blocks[-1] == q.result: # not the ones after a return
+            blocks.pop()
+    return blocks
+
+def _jump(quads: list[Quadruple], era, gosub, func, func_dir):
+    """
+    The quads which replace the call at era:gosub+1 and the return after it.
+    """
+    params, res = quads[era+1:gosub], []
+    args = [q.arg_1 for q in params]
+    for i, q in enumerate(params):
+        # an argument which is a param assigned before must be read before it changes
+        if not q.arg_1[2] and any(slot(q.arg_1) == slot(p.result) for p in params[:i]):
+            args[i] = func_dir.new_temp(MEM_ID_TO_TYPE[q.arg_1[3]], func).mem_dir
+            res.append(Quadruple("ASSIG", q.arg_1, None, args[i]))
+    res += [Quadruple("ASSIG", arg, None, q.result) for arg, q in zip(args, params)]
+    res += [Quadruple("ENDBLK", result=block) for block in reversed(_open_blocks(quads, func.q_index, gosub))]
+    res.append(Quadruple("GOTO", result=func.q_index))
+    return res
+
+def eliminate_tail_calls(quads: list[Quadruple], func_dir):
+    """
+    Returns the number of calls turned into jumps.
+    """
+    total = 0
+    while True:
+        funcs = _funcs(quads, func_dir)
+        for gosub, q in enumerate(quads):
+            if q.op != "GOSUB":
+                continue
+            # the innermost func the call is in
+            func = next((func for first, end, func in funcs if first <= gosub < end), None)
+            if func is not None and func.id == q.result and _is_tail_call(quads, gosub, func):
+                break
+        else:
+            return total
+        era = gosub - 1
+        while quads[era].op == "PARAM":
+            era -= 1
+        # the ASSIG and RETURN of the value go too, what follows a void call is left unreachable
+        end = gosub + (1 if func.func_var is None else 3)
+        replace_quads(quads, era, end, _jump(quads, era, gosub, func, func_dir), func_dir)
+        total += 1
@@ -3,6 +3,7 @@ from .structs.ast.Expressions import Assign, BinExpr, Const, Id, UnExpr, Access
 from .structs.ast.Statements import DimConst, TensorDecl, TensorDim, FuncDecl, VarDecl, Seq, If, While, For, Ret, FuncCall, IOFunc, Empty, TensConst
 from sly import Parser
 from .lexer import ParhlLexer
+from . import parser_tables
 
 class ParhlParser(Parser):
     # debugfile = 'parser.out'
@@ -17,6 +18,11 @@ class ParhlParser(Parser):
         ('left', MMULT, MULT, DIV, MOD),
         ('left', EXP)
     )
+
+    # Overrides sly's Parser.__build_lrtables so the tables are loaded from the cache when possible
+    @classmethod
+    def _Parser__build_lrtables(cls):
+        return parser_tables.build_lrtables(cls)
     
     @_('ignored_newlines globals_aux')
     def globals(self, p):
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+
+"""
+Cache of the LALR tables of sly parsers.
+sly rebuilds the tables every time the parser class is created (i.e. on every import), here the
+tables are stored in CACHE_DIR keyed on a hash of the grammar and loaded back while the grammar does not change.
+"""
+
+CACHE_DIR = os.environ.get("PARHL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "parhl"))
+
+class CachedLRTable():
+    """
+    The parts of sly's LRTable used while parsing.
+    """
+    def __init__(self, lr_action, lr_goto, defaulted_states, sr_conflicts, rr_conflicts):
+        self.lr_action = lr_action
+        self.lr_goto = lr_goto
+        self.defaulted_states = defaulted_states
+        self.sr_conflicts = sr_conflicts
+        self.rr_conflicts = rr_conflicts
+
+def grammar_hash(parser_cls):
+    import sly
+    grammar = parser_cls._grammar
+    key = repr((
+        sly.__version__,
+        str(grammar),
+        [(str(p), p.prec) for p in grammar.Productions if p],
+        sorted(grammar.Precedence.items()),
+        sorted(parser_cls.tokens),
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def tables_file(parser_cls):
+    return os.path.join(CACHE_DIR, f"{parser_cls.__name__}-{grammar_hash(parser_cls)[:16]}.tables")
+
+def _log_conflicts(parser_cls, lrtable):
+    # same warnings sly gives when it builds the tables
+    for kind, attr, expected in (('shift/reduce', 'sr_conflicts', 'expected_shift_reduce'),
+                                 ('reduce/reduce', 'rr_conflicts', 'expected_reduce_reduce')):
+        num = len(getattr(lrtable, attr))
+        if num != getattr(parser_cls, expected, None) and num > 0:
+            parser_cls.log.warning(f'{num} {kind} conflict' + ('s' if num > 1 else ''))
+
+def build_lrtables(parser_cls):
+    """
+    Replaces sly's table construction, the grammar is already built when this runs.
+    """
+    file = tables_file(parser_cls)
+    try:
+        with open(file, "rb") as tables:
+            lrtable = pickle.load(tables)
+        if type(lrtable) != CachedLRTable:
+            raise TypeError(f"{file} does not hold parser tables")
+        _log_conflicts(parser_cls, lrtable)
+        parser_cls._lrtable = lrtable
+        return True
+    except Exception:
+        pass # missing, unreadable or foreign cache, the tables are built and the file overwritten
+
+    # sly's own construction, called on the parser class instead of sly's Parser
+    from sly import Parser
+    if not Parser.__dict__['_Parser__build_lrtables'].__func__(parser_cls):
+        return False
+    if parser_cls.debugfile: # the debug file needs the full table
+        return True
+    lrtable = parser_cls._lrtable
+    cached = CachedLRTable(lrtable.lr_action, lrtable.lr_goto, lrtable.defaulted_states,
+        lrtable.sr_conflicts, lrtable.rr_conflicts)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as tables:
+            pickle.dump(cached, tables)
+        os.replace(tmp_file, file) # atomic, concurrent compilers never read half written tables
+    except OSError:
+        pass # the cache is only an optimization
+    return True
@@ -7,6 +7,7 @@ from ..quadruples import Quadruple
 from ...lexer import symbol_to_token
 from functools import reduce
 from ..tensor_shape_utils import matmul, broadcast, matpow
+from ..const_folding import fold, is_identity
 
 Expression = Node
 
@@ -27,10 +28,7 @@ class Assign(Expression):
                 raise ParhlException('Tensor assign failed: tensor dimensions do not match')
             
             total = reduce(lambda x,y: x*y, [dim['n'] for dim in right_var.dims])
-            for i in range(0, total):
-                origin_mem_dir = (right_var.mem_dir[0], right_var.mem_dir[1] + i, right_var.mem_dir[2], right_var.mem_dir[3])
-                dest_mem_dir = (left_var.mem_dir[0], left_var.mem_dir[1] + i, left_var.mem_dir[2], left_var.mem_dir[3])
-                ctx.add_quadruple(Quadruple('ASSIG', origin_mem_dir, result=dest_mem_dir))
+            ctx.add_quadruple(Quadruple('COPY', right_var.mem_dir, total, left_var.mem_dir))
         else: # regular primitive assign
             if type(left_var) == Tensor:
                 raise ParhlException('Cannot assign a primitive to a tensor')
@@ -63,6 +61,9 @@ class BinExpr(Expression):
         except Exception:
             raise ParhlException(f"Can not perform {op_name} in tensors with dims {left_dims} and {right_dims}")
         new_type = ctx.semantic_cube.get_type(op_name, left_var.type, right_var.type)
+        identity_var = self._identity_operand(ctx, left_var, right_var, op_name, new_type)
+        if identity_var is not None:
+            return identity_var
         if len(res_dims) == 0:
             temp_var = ctx.func_dir.new_temp(new_type)
         else:
@@ -70,13 +71,39 @@ class BinExpr(Expression):
         ctx.add_quadruple(Quadruple(op_name, (left_var.mem_dir, left_dims), (right_var.mem_dir, right_dims), temp_var.mem_dir))
         return temp_var
 
+    def _identity_operand(self, ctx: ParseContext, left_var, right_var, op_name, new_type):
+        # the operand the operation gives back, like x in x*1 or 0+x
+        right_const = self.right.const_value(ctx)
+        if right_const is not None and left_var.type == new_type and is_identity(op_name, right_const[0], new_type):
+            return left_var
+        left_const = self.left.const_value(ctx)
+        if left_const is not None and right_var.type == new_type and is_identity(op_name, left_const[0], new_type, right=False):
+            return right_var
+        return None
+
+    def const_value(self, ctx: ParseContext):
+        left = self.left.const_value(ctx)
+        right = self.right.const_value(ctx) if left is not None else None
+        if right is None:
+            return None
+        op_name = symbol_to_token[self.op]
+        new_type = ctx.semantic_cube.get_type(op_name, left[1], right[1])
+        value = fold(op_name, new_type, left[0], right[0])
+        return (value, new_type) if value is not None else None
+
     def gen_impl(self, ctx: ParseContext):
+        folded = self.const_value(ctx)
+        if folded is not None:
+            return ctx.func_dir.get_or_new_const(folded[1], folded[0])
         left_var = self.left.gen(ctx)
         right_var = self.right.gen(ctx)
         op_name = symbol_to_token[self.op]
         if type(left_var) == Tensor or type(right_var) == Tensor:
             return self._gen_impl_tens(ctx, left_var, right_var, op_name)
         new_type = ctx.semantic_cube.get_type(op_name, left_var.type, right_var.type)
+        identity_var = self._identity_operand(ctx, left_var, right_var, op_name, new_type)
+        if identity_var is not None:
+            return identity_var
         temp_var = ctx.func_dir.new_temp(new_type)
         ctx.add_quadruple(Quadruple(op_name, left_var.mem_dir, right_var.mem_dir, temp_var.mem_dir))
         return temp_var
@@ -91,6 +118,9 @@ class Const(Expression):
         self.token_type = type
         self.type = type.replace('V', 'T')
         
+    def const_value(self, ctx: ParseContext):
+        return self.value, self.type
+
     def gen_impl(self, ctx: ParseContext):
         # Guardar en memoria de constantes
         const_var = ctx.func_dir.get_or_new_const(self.type, self.value)
@@ -114,6 +144,19 @@ class Access(Expression):
     def id(self):
         return self.id_access.id
 
+    def _index_exprs(self):
+        seq = self.expr_seq
+        while seq:
+            yield seq.stmt
+            seq = seq.seq
+
+    @staticmethod
+    def _in_bounds(ctx: ParseContext, expr, var, n):
+        if var in ctx.loop_bounds:
+            return ctx.loop_bounds[var] <= n
+        value = expr.const_value(ctx)
+        return value is not None and 0 <= value[0] < n
+
     def gen_impl(self, ctx: ParseContext):
         tens = ctx.func_dir.get_var(self.id)
         exprs = self.expr_seq.gen_ret_list(ctx)
@@ -122,30 +165,35 @@ class Access(Expression):
         if len(tens.dims) != len(exprs):
             raise ParhlException('Not enough indices provided to tensor accessor')
         
-        last = len(exprs) - 1
-        zero_var = ctx.func_dir.get_or_new_const('INT_T',0)
-        total_var = ctx.func_dir.new_temp('INT_T');
-        ctx.add_quadruple(Quadruple('ASSIG', zero_var.mem_dir, result=total_var.mem_dir))
-
         for i, var in enumerate(exprs):
             if var.type != 'INT_T':
                 raise ParhlException(f"Expected integer at dimension {i} but got {var.type}")
-            ctx.add_quadruple(Quadruple('VERIFY', tens.dims[i]['limit'].mem_dir, result=var.mem_dir))
-            new_temp = ctx.func_dir.new_temp('INT_T')
-            ctx.add_quadruple(Quadruple('MULT', var.mem_dir, tens.dims[i]['m'].mem_dir, new_temp.mem_dir))
-            ctx.add_quadruple(Quadruple('PLUS', new_temp.mem_dir, total_var.mem_dir, total_var.mem_dir))
-            if i == last:
-                # Copy vars from base addr variables
-                copy = [None] * len(tens.addr_vars)
-                for i, addr_var in enumerate(tens.addr_vars):
-                    copy[i] = ctx.func_dir.new_temp(addr_var.type)
-                    ctx.add_quadruple(Quadruple('ASSIG', addr_var.mem_dir, result=copy[i].mem_dir))
-                ctx.add_quadruple(Quadruple('PLUS', total_var.mem_dir, tens.addr_vars[1].mem_dir, copy[1].mem_dir))
-                func, var, _, p_type = copy[0].mem_dir
-                # copy[0] is actually a pointer
-                copy[0].type = tens.type
-                copy[0].mem_dir = (func, var, 1, p_type)
-                return copy[0]
+        # pointers are 4 consecutive INT temps: func id, var num, dereference and type
+        pointer = [ctx.func_dir.new_temp('INT_T') for _ in range(4)]
+        # INDEX checks the bounds of every index and writes the address of the element to the pointer
+        dims = [dim['n'] for dim in tens.dims]
+        # the check is dropped when every index is a constant or a for loop var counting below its dim
+        in_bounds = all(self._in_bounds(ctx, expr, var, n) for expr, var, n in zip(self._index_exprs(), exprs, dims))
+        op = 'UNCHECKED_INDEX' if in_bounds and not ctx.check_bounds else 'INDEX'
+        ctx.add_quadruple(Quadruple(op, (tens.mem_dir, dims), [var.mem_dir for var in exprs], pointer[0].mem_dir))
+        func, var, _, p_type = pointer[0].mem_dir
+        # pointer[0] is actually a pointer
+        pointer[0].type = tens.type
+        pointer[0].mem_dir = (func, var, 1, p_type)
+        return pointer[0]
+
+class TensSlice(Expression):
+    """
+    The first n elements of a 1-d tensor, what a vectorized for loop reads and writes in place of tens[i].
+    """
+    def __init__(self, line, id, n):
+        super().__init__(line)
+        self.id = id
+        self.n = n
+
+    def gen_impl(self, ctx: ParseContext):
+        tens = ctx.func_dir.get_var(self.id)
+        return Tensor(tens.name, tens.type, tens.mem_dir, dims=[{'n': self.n}])
 
 class UnExpr(Expression):
     def __init__(self, line, op, right):
@@ -160,9 +208,24 @@ class UnExpr(Expression):
         ctx.add_quadruple(Quadruple(op_name, (right_var.mem_dir, right_dims), None, temp_var.mem_dir))
         return temp_var
 
+    def const_value(self, ctx: ParseContext):
+        right = self.right.const_value(ctx)
+        if right is None:
+            return None
+        op_name = symbol_to_token[self.op]
+        new_type = ctx.semantic_cube.get_type(op_name, right[1])
+        value = fold(op_name, new_type, right[0])
+        return (value, new_type) if value is not None else None
+
     def gen_impl(self, ctx: ParseContext):
+        folded = self.const_value(ctx)
+        if folded is not None:
+            return ctx.func_dir.get_or_new_const(folded[1], folded[0])
         right_var = self.right.gen(ctx)
         op_name = symbol_to_token[self.op]
+        # +x is x
+        if op_name == 'PLUS' and ctx.semantic_cube.get_type(op_name, right_var.type) == right_var.type:
+            return right_var
         if type(right_var) == Tensor:
             return self._gen_impl_tens(ctx, right_var, op_name)
         new_type = ctx.semantic_cube.get_type(op_name, right_var.type)
@@ -26,5 +26,11 @@ class Node(ABC):
     def gen(self, context):
         return self.gen_impl(context)
 
+    def const_value(self, context):
+        """
+        (value, type) when the node is an expression known at compile time, None otherwise.
+        """
+        return None
+
     def __init__(self, lineno):
         self.lineno = lineno
\ No newline at end of file
@@ -3,8 +3,8 @@ from ..parhl_exceptions import ParhlException
 from ..quadruples import Quadruple
 from ..parse_context import ParseContext
 from .Node import Node
-from .Expressions import Assign, Expression
-from ...lexer import type_to_token
+from .Expressions import Access, Assign, BinExpr, Expression, Const, Id, TensSlice, UnExpr
+from ...lexer import symbol_to_token, type_to_token
 from functools import reduce
 
 Statement = Node
@@ -99,6 +99,23 @@ class While(Statement):
         ctx.add_quadruple(Quadruple('GOTO',result=jump_index))
         ctx.set_goto_position(gotof_index)
 
+def assigned_ids(node):
+    """
+    Ids of the vars assigned anywhere inside node.
+    """
+    res, stack = set(), [node]
+    while stack:
+        node = stack.pop()
+        if type(node) == Assign and type(node.left) == Id:
+            res.add(node.left.id)
+        stack.extend(child for child in vars(node).values() if isinstance(child, Node))
+    return res
+
+# op_name of the ops a vectorized loop runs on whole tensors, the ones which work element by element.
+# A 0 divisor gives the same values on scalars and tensors (inf or nan, cast to int by INT_T) and an int
+# modulo by 0 fails on both
+VECTOR_OPS = {'PLUS', 'MINUS', 'MULT', 'DIV', 'MOD', 'AND', 'OR', 'NOT'}
+
 class For(Statement):
     def __init__(self, line, var, expr, assign, seq=Empty()):
         super().__init__(line)
@@ -107,19 +124,135 @@ class For(Statement):
         self.assign = assign
         self.seq = seq
 
+    def _loop_bound(self, ctx: ParseContext):
+        """
+        (var, bound) when the condition is "var < bound" or "var <= bound - 1" for a var declared by the loop,
+        a constant bound and a body which never assigns var, so var < bound holds all along the body.
+        """
+        expr = self.expr
+        if type(expr) != BinExpr or expr.op not in ('<', '<=') or type(expr.left) != Id:
+            return None
+        declared, decls = set(), self.var
+        while decls:
+            if type(decls.stmt) == VarDecl:
+                declared.add(decls.stmt.id.id)
+            decls = decls.seq
+        bound = expr.right.const_value(ctx)
+        if expr.left.id not in declared or bound is None or bound[1] != 'INT_T' or expr.left.id in assigned_ids(self.seq):
+            return None
+        return ctx.func_dir.get_var(expr.left.id), bound[0] + (expr.op == '<=')
+
+    def _counter(self, ctx: ParseContext):
+        """
+        (var, bound expr) when the loop is "for(let var : int := 0; var < bound; var := var + 1)".
+        """
+        decl, expr, step = self.var.stmt, self.expr, self.assign
+        if self.var.seq or type(decl) != VarDecl or decl.id_type != 'INT_T' or not decl.assign:
+            return None
+        var = decl.id.id
+        if decl.assign.right.const_value(ctx) != (0, 'INT_T'):
+            return None
+        if type(expr) != BinExpr or expr.op != '<' or type(expr.left) != Id or expr.left.id != var:
+            return None
+        right = step.right
+        if type(step.left) != Id or step.left.id != var or type(right) != BinExpr or right.op != '+':
+            return None
+        if type(right.left) != Id or right.left.id != var or right.right.const_value(ctx) != (1, 'INT_T'):
+            return None
+        return var, expr.right
+
+    def _vector_expr(self, ctx: ParseContext, expr, var, n):
+        """
+        (expr over whole tensors, type) for an element by element expr of the body, None when it is not one.
+        Accesses tens[var] to 1-d tensors become the first n elements of tens.
+        """
+        if type(expr) == Const:
+            return (expr, expr.type) if expr.type != 'STRING_T' else None
+        if type(expr) == Id:
+            scalar = expr.id != var and ctx.func_dir.get_var(expr.id)
+            return (expr, scalar.type) if scalar and type(scalar) != Tensor and scalar.type != 'STRING_T' else None
+        if type(expr) == Access:
+            tens = ctx.func_dir.get_var(expr.id)
+            index = list(expr._index_exprs())
+            if (type(tens) != Tensor or len(tens.dims) != 1 or tens.dims[0]['n'] < n or tens.type == 'STRING_T'
+                or len(index) != 1 or type(index[0]) != Id or index[0].id != var):
+                return None
+            return TensSlice(expr.lineno, expr.id, n), tens.type
+        if type(expr) not in (BinExpr, UnExpr):
+            return None
+        op_name = symbol_to_token[expr.op]
+        if op_name not in VECTOR_OPS:
+            return None
+        right = self._vector_expr(ctx, expr.right, var, n)
+        left = self._vector_expr(ctx, expr.left, var, n) if type(expr) == BinExpr else None
+        if right is None or (type(expr) == BinExpr and left is None):
+            return None
+        if type(expr) == UnExpr:
+            return UnExpr(expr.lineno, expr.op, right[0]), ctx.semantic_cube.get_type(op_name, right[1])
+        new_type = ctx.semantic_cube.get_type(op_name, left[1], right[1])
+        return BinExpr(expr.lineno, left[0], expr.op, right[0]), new_type
+
+    def _vectorized(self, ctx: ParseContext):
+        """
+        The assignments of the body over whole tensors, when the loop counts var from 0 to a constant n and
+        its body only assigns elements tens[var] of 1-d tensors with expressions of elements [var] of 1-d tensors,
+        constants and vars the loop does not change. Every element is only read and written by its own iteration,
+        so running every assignment over the n first elements, one after the other, is the same as the loop.
+        None when the loop can not be vectorized.
+        """
+        counter = self._counter(ctx)
+        bound = counter[1].const_value(ctx) if counter else None
+        if bound is None or bound[1] != 'INT_T' or bound[0] <= 0:
+            return None
+        var, n = counter[0], bound[0]
+        assigns, seq = [], self.seq
+        while seq:
+            stmt, seq = seq.stmt, seq.seq
+            if type(stmt) == Empty:
+                continue
+            if type(stmt) != Assign or type(stmt.left) != Access:
+                return None
+            try:
+                left = self._vector_expr(ctx, stmt.left, var, n)
+                right = self._vector_expr(ctx, stmt.right, var, n)
+            except ParhlException: # the loop reports it
+                return None
+            # scalars are not broadcast into the tensor and the tensor copy does not cast
+            if left is None or right is None or left[1] != right[1] or not self._reads_tensor(right[0]):
+                return None
+            assigns.append(Assign(stmt.lineno, left[0], right[0]))
+        return assigns or None
+
+    @staticmethod
+    def _reads_tensor(expr):
+        if type(expr) == TensSlice:
+            return True
+        return any(For._reads_tensor(child) for child in (getattr(expr, 'left', None), getattr(expr, 'right', None))
+            if child is not None)
+
     def gen_impl(self, ctx: ParseContext): 
+        vectorized = self._vectorized(ctx)
+        if vectorized:
+            for assign in vectorized:
+                assign.gen(ctx)
+            return
         # We create a "virtual" surrounding block s.t. "var" only lives in such scope
         ctx.func_dir.start_block_stack()
         ctx.add_quadruple(Quadruple('STRTBLK', result=ctx.func_dir.curr_scope.id))
         
         self.var.gen(ctx)
+        loop_bound = self._loop_bound(ctx)
         jump_index = ctx.get_next_quadruple_index()
         
         var = self.expr.gen(ctx)
         gotof_index = ctx.add_quadruple(Quadruple('GOTOF', var.mem_dir))
         ctx.func_dir.start_block_stack()
         ctx.add_quadruple(Quadruple('STRTBLK', result=ctx.func_dir.curr_scope.id))
+        if loop_bound:
+            ctx.loop_bounds[loop_bound[0]] = loop_bound[1]
         self.seq.gen(ctx)
+        if loop_bound:
+            del ctx.loop_bounds[loop_bound[0]]
         self.assign.gen(ctx)
         ctx.add_quadruple(Quadruple('ENDBLK', result=ctx.func_dir.curr_scope.id))
         ctx.func_dir.end_block_stack()
@@ -175,7 +308,38 @@ class TensConst(Statement):
         self.expr_seq = expr_seq;
         self.is_first = True # assume we are on the top level tensor
     
+    def const_values(self):
+        """
+        Returns (flat values, dims, type) when every element of the literal is a constant, None otherwise.
+        Literals which do not type check also return None so gen_impl reports the error.
+        """
+        values, dims, checked_type, size = [], None, None, 0
+        curr = self.expr_seq
+        while type(curr) != Empty:
+            if type(curr.stmt) == Const:
+                stmt_values, stmt_dims, stmt_type = [curr.stmt.value], [], curr.stmt.type
+            elif type(curr.stmt) == TensConst:
+                stmt_const = curr.stmt.const_values()
+                if stmt_const is None:
+                    return None
+                stmt_values, stmt_dims, stmt_type = stmt_const
+            else:
+                return None
+            if dims is not None and (dims != stmt_dims or checked_type != stmt_type):
+                return None
+            values.extend(stmt_values)
+            dims, checked_type, size = stmt_dims, stmt_type, size + 1
+            curr = curr.seq
+        return values, [size] + dims, checked_type
+
     def gen_impl(self, ctx: ParseContext):
+        if self.is_first:
+            # Constant literals are not split into scalar constants
+            literal = self.const_values()
+            if literal is not None:
+                values, dims, checked_type = literal
+                return ctx.func_dir.new_tens_literal(checked_type, values, dims)
+
         # First always make subsequent tensors know they are not first
         curr = self.expr_seq
         is_tensor_const = type(curr.stmt) == TensConst
@@ -208,12 +372,25 @@ class TensConst(Statement):
         # We know we are on first, so allocate memory to tensor and assign it all values
 
         tens_temp : Tensor = ctx.func_dir.new_tens_temp(checked_type, dims)
-        #Assign all values to temp tens
-        for i, origin_mem_dir in enumerate(mem_dirs):
+        #Assign all values to temp tens, values in consecutive memory are copied with a single quad
+        for i, origin_mem_dir, count in consecutive_runs(mem_dirs):
             dest_mem_dir = (tens_temp.mem_dir[0], tens_temp.mem_dir[1] + i, tens_temp.mem_dir[2], tens_temp.mem_dir[3])
-            ctx.add_quadruple(Quadruple('ASSIG', origin_mem_dir, result=dest_mem_dir))
+            if count == 1:
+                ctx.add_quadruple(Quadruple('ASSIG', origin_mem_dir, result=dest_mem_dir))
+            else:
+                ctx.add_quadruple(Quadruple('COPY', origin_mem_dir, count, dest_mem_dir))
         return tens_temp
 
+def consecutive_runs(mem_dirs):
+    # yields (position, first mem_dir, count) for every run of consecutive mem_dirs
+    start = 0
+    for i in range(1, len(mem_dirs) + 1):
+        prev = mem_dirs[i-1]
+        if i < len(mem_dirs) and mem_dirs[i] == (prev[0], prev[1] + 1, prev[2], prev[3]) and not prev[2]:
+            continue
+        yield start, mem_dirs[start], i - start
+        start = i
+
 class FuncDecl(Statement):
     def __init__(self, line, id, id_type, params_seq, seq):
         super().__init__(line)
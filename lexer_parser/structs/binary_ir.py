@@ -0,0 +1,287 @@
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from .parhl_exceptions import ParhlException
+
+"""
+Binary IR format, an alternative to the json IR meant for big programs.
+
+Layout: header | string table | dims table | func dir | quads
+- The string table holds opcodes, type names and string constants, everything else refers to them by index.
+- The dims table is a flat array of ints, every tensor dimensions list is stored as its length followed
+  by the dimensions and referenced by its offset. Lists of mem_dirs (the indexes of INDEX ops) are stored
+  the same way, flattened, and so are the inputs and the program of FUSED kernels.
+- Constants are stored as typed arrays per type.
+- Quads are fixed width records so the vm can mmap the file and decode a quad only when it is needed.
+"""
+
+MAGIC = b'PRHL'
+VERSION = 1
+BINARY_IR_EXT = '.pbc'
+
+HEADER = struct.Struct('<4sHHIIIIQQQQ') # magic, version, reserved, # strings, # dims, # funcs, # quads, section offsets
+U8, U32, MEM_DIR = struct.Struct('<B'), struct.Struct('<I'), struct.Struct('<iiii')
+# kind, deref, type, func id, var num / int value / string index, dims offset
+OPERAND_FMT = 'BBBIiI'
+QUAD = struct.Struct('<H' + OPERAND_FMT * 3)
+
+# operand kinds
+NONE_OPD, INT_OPD, MEM_DIR_OPD, TENS_OPD, DIMS_OPD, TYPED_DIMS_OPD, MEM_DIRS_OPD, TENS_LIST_OPD, PROGRAM_OPD = range(9)
+# op : {position : kind} of its list operands, they can not be told apart from dims by their shape
+LIST_OPERANDS = {
+    'INDEX': {2: MEM_DIRS_OPD},
+    'UNCHECKED_INDEX': {2: MEM_DIRS_OPD},
+    'FUSED': {1: TENS_LIST_OPD, 2: PROGRAM_OPD},
+}
+
+# typed arrays used for the values of every type, strings are indexes of the string table
+TYPES = ['STRING_T', 'INT_T', 'FLOAT_T', 'BOOL_T', 'GPU_INT_T', 'GPU_FLOAT_T', 'GPU_BOOL_T']
+CPU_TYPES = TYPES[:4]
+TYPE_CODES = {
+    'STRING_T' : 'I',
+    'INT_T' : 'q',
+    'FLOAT_T' : 'd',
+    'BOOL_T' : 'B',
+    'GPU_INT_T' : 'q',
+    'GPU_FLOAT_T' : 'd',
+    'GPU_BOOL_T' : 'B',
+}
+# func dir record kinds
+BLOCK_REC, FUNC_REC, FUNC_W_VAR_REC = range(3)
+
+def _to_bytes(code, values):
+    arr = array(code, values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+def _overflows(code, value):
+    try:
+        array(code, [value])
+    except OverflowError:
+        return True
+    return False
+
+def _from_bytes(code, data):
+    arr = array(code)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tolist()
+
+class _Writer():
+    def __init__(self):
+        self.strings: dict[str, int] = {} # string : index
+        self.dims: list[int] = []
+
+    def string(self, s):
+        return self.strings.setdefault(s, len(self.strings))
+
+    def dims_ref(self, dims):
+        self.dims.append(len(dims))
+        self.dims.extend(dims)
+        return len(self.dims) - len(dims) - 1
+
+    def typed_values(self, type, values):
+        if type == 'STRING_T':
+            values = [self.string(v) for v in values]
+        try:
+            return _to_bytes(TYPE_CODES[type], values)
+        except OverflowError:
+            out_of_range = next(v for v in values if _overflows(TYPE_CODES[type], v))
+            raise ParhlException(f"Constant {out_of_range} does not fit in the {type} of the binary IR")
+
+    def operand(self, opd, list_kind=None):
+        if list_kind == MEM_DIRS_OPD:
+            return (MEM_DIRS_OPD, 0, 0, 0, 0, self.dims_ref([x for mem_dir in opd for x in mem_dir]))
+        if list_kind == TENS_LIST_OPD: # mem_dir, # of dims and dims of every tensor operand
+            flat = [x for mem_dir, dims in opd for x in [*mem_dir, len(dims), *dims]]
+            return (TENS_LIST_OPD, 0, 0, 0, 0, self.dims_ref(flat))
+        if list_kind == PROGRAM_OPD: # op_name, operands and type id of every step, -1 for no operand
+            flat = [x for op, l, r, tid in opd for x in (self.string(op), l, -1 if r is None else r, tid)]
+            return (PROGRAM_OPD, 0, 0, 0, 0, self.dims_ref(flat))
+        if opd is None:
+            return (NONE_OPD, 0, 0, 0, 0, 0)
+        if isinstance(opd, int):
+            return (INT_OPD, 0, 0, 0, opd, 0)
+        if len(opd) == 4 and all(isinstance(x, int) for x in opd):
+            fid, idx, deref, tid = opd
+            return (MEM_DIR_OPD, deref, tid, fid, idx, 0)
+        if len(opd) == 2 and isinstance(opd[0], (list, tuple)): # tensor, (mem_dir, dims)
+            fid, idx, deref, tid = opd[0]
+            return (TENS_OPD, deref, tid, fid, idx, self.dims_ref(opd[1]))
+        if len(opd) > 0 and isinstance(opd[0], str): # (type, *dims)
+            return (TYPED_DIMS_OPD, 0, 0, 0, self.string(opd[0]), self.dims_ref(opd[1:]))
+        if all(isinstance(x, int) for x in opd):
+            return (DIMS_OPD, 0, 0, 0, 0, self.dims_ref(opd))
+        raise Exception(f"Operand {opd} can not be stored in the binary IR")
+
+    def func(self, func):
+        cpu_var_counter, consts, gpu_var_counter, tens_regions, tens_consts = func[:5]
+        out = bytearray()
+        if len(func) == 5:
+            out += U8.pack(BLOCK_REC)
+        elif func[5] is None:
+            out += U8.pack(FUNC_REC)
+        else:
+            out += U8.pack(FUNC_W_VAR_REC) + MEM_DIR.pack(*func[5])
+        counters = cpu_var_counter | gpu_var_counter
+        out += _to_bytes('I', [counters[type] for type in TYPES])
+        for type in CPU_TYPES:
+            type_consts = consts.get(type, [])
+            out += U32.pack(len(type_consts))
+            out += self.typed_values(type, [val for val, _ in type_consts])
+            out += _to_bytes('i', [x for _, mem_dir in type_consts for x in mem_dir])
+        for type in TYPES:
+            regions = tens_regions.get(type, [])
+            out += U32.pack(len(regions)) + _to_bytes('I', [x for region in regions for x in region])
+        for type in TYPES:
+            type_tens_consts = tens_consts.get(type, [])
+            out += U32.pack(len(type_tens_consts))
+            for values, mem_dir in type_tens_consts:
+                out += MEM_DIR.pack(*mem_dir) + U32.pack(len(values)) + self.typed_values(type, values)
+        return out
+
+def dump(ir, file):
+    """
+    Writes the ir dict ({"func_dir": [...], "quads": [...]}) to file in the binary IR format.
+    """
+    writer = _Writer()
+    funcs = b''.join(writer.func(func) for func in ir["func_dir"])
+    def operands(q):
+        list_kinds = LIST_OPERANDS.get(q[0], {})
+        return (x for i in range(1, 4) for x in writer.operand(q[i], list_kinds.get(i)))
+    quads = b''.join(QUAD.pack(writer.string(q[0]), *operands(q)) for q in ir["quads"])
+    strings = b''.join(U32.pack(len(b)) + b for b in (s.encode() for s in writer.strings))
+    dims = _to_bytes('i', writer.dims)
+    strings_off = HEADER.size
+    dims_off = strings_off + len(strings)
+    funcs_off = dims_off + len(dims)
+    quads_off = funcs_off + len(funcs)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(writer.strings), len(writer.dims), len(ir["func_dir"]),
+        len(ir["quads"]), strings_off, dims_off, funcs_off, quads_off)
+    with open(file, "wb") as out_file:
+        out_file.write(header + strings + dims + funcs + quads)
+
+class BinaryQuads(Sequence):
+    """
+    Read only view of the quads of a mmaped binary IR, every quad is decoded when accessed.
+    """
+    def __init__(self, buf, offset, n_quads, strings, dims):
+        self.buf = buf
+        self.offset = offset
+        self.n_quads = n_quads
+        self.strings = strings
+        self.dims = dims
+
+    def __len__(self):
+        return self.n_quads
+
+    def _operand(self, kind, deref, tid, fid, val, dims_off):
+        if kind == MEM_DIR_OPD:
+            return [fid, val, deref, tid]
+        if kind == NONE_OPD:
+            return None
+        if kind == INT_OPD:
+            return val
+        dims = self.dims[dims_off+1:dims_off+1+self.dims[dims_off]]
+        if kind == TENS_OPD:
+            return [[fid, val, deref, tid], dims]
+        if kind == TYPED_DIMS_OPD:
+            return [self.strings[val]] + dims
+        if kind == MEM_DIRS_OPD:
+            return [dims[i:i+4] for i in range(0, len(dims), 4)]
+        if kind == TENS_LIST_OPD:
+            opds, i = [], 0
+            while i < len(dims):
+                n_dims = dims[i+4]
+                opds.append([dims[i:i+4], dims[i+5:i+5+n_dims]])
+                i += 5 + n_dims
+            return opds
+        if kind == PROGRAM_OPD:
+            return [[self.strings[dims[i]], dims[i+1], None if dims[i+2] == -1 else dims[i+2], dims[i+3]]
+                for i in range(0, len(dims), 4)]
+        return dims
+
+    def __getitem__(self, q_idx):
+        if not 0 <= q_idx < self.n_quads:
+            raise IndexError(q_idx)
+        fields, operand = QUAD.unpack_from(self.buf, self.offset + q_idx * QUAD.size), self._operand
+        return [self.strings[fields[0]], operand(*fields[1:7]), operand(*fields[7:13]), operand(*fields[13:19])]
+
+class _Reader():
+    def __init__(self, buf, strings):
+        self.buf = buf
+        self.strings = strings
+        self.pos = 0
+
+    def unpack(self, st):
+        vals = st.unpack_from(self.buf, self.pos)
+        self.pos += st.size
+        return vals
+
+    def array(self, code, n):
+        size = array(code).itemsize * n
+        vals = _from_bytes(code, self.buf[self.pos:self.pos+size])
+        self.pos += size
+        return vals
+
+    def typed_values(self, type, n):
+        vals = self.array(TYPE_CODES[type], n)
+        if type == 'STRING_T':
+            return [self.strings[v] for v in vals]
+        if type in ('BOOL_T', 'GPU_BOOL_T'):
+            return [bool(v) for v in vals]
+        return vals
+
+    def func(self):
+        rec_kind, = self.unpack(U8)
+        func_var = list(self.unpack(MEM_DIR)) if rec_kind == FUNC_W_VAR_REC else None
+        counters = dict(zip(TYPES, self.array('I', len(TYPES))))
+        cpu_var_counter = {type: counters[type] for type in CPU_TYPES}
+        gpu_var_counter = {type: counters[type] for type in TYPES[4:]}
+        consts = {}
+        for type in CPU_TYPES:
+            n, = self.unpack(U32)
+            values, mem_dirs = self.typed_values(type, n), self.array('i', 4 * n)
+            consts[type] = [[val, mem_dirs[4*i:4*i+4]] for i, val in enumerate(values)]
+        tens_regions = {}
+        for type in TYPES:
+            n, = self.unpack(U32)
+            if n:
+                flat = self.array('I', 2 * n)
+                tens_regions[type] = [flat[2*i:2*i+2] for i in range(n)]
+        tens_consts = {}
+        for type in TYPES:
+            n, = self.unpack(U32)
+            for _ in range(n):
+                mem_dir = list(self.unpack(MEM_DIR))
+                size, = self.unpack(U32)
+                tens_consts.setdefault(type, []).append([self.typed_values(type, size), mem_dir])
+        func = [cpu_var_counter, consts, gpu_var_counter, tens_regions, tens_consts]
+        return func if rec_kind == BLOCK_REC else func + [func_var]
+
+def load(file):
+    """
+    Maps a binary IR file, returns (func_dir, quads) where quads are decoded lazily.
+    """
+    with open(file, "rb") as ir_file:
+        buf = mmap.mmap(ir_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, n_strings, n_dims, n_funcs, n_quads, strings_off, dims_off, funcs_off, quads_off = \
+        HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise Exception(f"{file} is not a binary IR file of version {VERSION}")
+    strings, pos = [], strings_off
+    for _ in range(n_strings):
+        size, = U32.unpack_from(buf, pos)
+        strings.append(buf[pos+4:pos+4+size].decode())
+        pos += 4 + size
+    dims = _from_bytes('i', buf[dims_off:dims_off + 4 * n_dims])
+    reader = _Reader(memoryview(buf)[funcs_off:quads_off], strings)
+    func_dir = [reader.func() for _ in range(n_funcs)]
+    return func_dir, BinaryQuads(buf, quads_off, n_quads, strings, dims)
+
+def is_binary_ir(file):
+    return file.endswith(BINARY_IR_EXT)
@@ -0,0 +1,69 @@
+import operator
+
+"""
+Compile time evaluation of operations on constants, the values are the ones the vm computes:
+the python operation followed by the cast of storing the result in a var of the result type.
+"""
+
+BIN_OPS = {
+    'PLUS': operator.add,
+    'MINUS': operator.sub,
+    'DIV': operator.truediv,
+    'MULT': operator.mul,
+    'MMULT': operator.mul,
+    'MOD': operator.mod,
+    'EXP': operator.pow,
+    'EQ': operator.eq,
+    'NOT_EQ': operator.ne,
+    'GEQT': operator.ge,
+    'LEQT': operator.le,
+    'GT': operator.gt,
+    'LT': operator.lt,
+    'AND': operator.and_,
+    'OR': operator.or_,
+}
+UN_OPS = {
+    'PLUS': lambda x: x,
+    'MINUS': operator.neg,
+    'NOT': operator.not_,
+}
+CASTS = {'INT_T': int, 'FLOAT_T': float, 'BOOL_T': bool, 'STRING_T': str}
+# bigger exponents are left to the vm instead of making the compiler build huge ints
+MAX_FOLDED_EXP = 1024
+# range of INT_T, the vm wraps the results out of it around
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+# op_name : value x can be operated with (on the right) to get x back
+RIGHT_IDENTITIES = {'PLUS': 0, 'MINUS': 0, 'MULT': 1, 'DIV': 1, 'EXP': 1}
+# op_name : value x can be operated with (on the left) to get x back
+LEFT_IDENTITIES = {'PLUS': 0, 'MULT': 1}
+# x + 0.0 is not x for x = -0.0
+INT_ONLY_IDENTITIES = {'PLUS', 'MINUS'}
+
+def fold(op_name, res_type, *values):
+    """
+    Value of op_name applied to the constant values, None when it is left for the vm
+    (GPU results, errors like a division by zero which must happen when the program runs, INT_T results
+    out of the int64 range).
+    """
+    if res_type not in CASTS:
+        return None
+    if op_name == 'EXP' and abs(values[1]) > MAX_FOLDED_EXP:
+        return None
+    op = BIN_OPS[op_name] if len(values) == 2 else UN_OPS[op_name]
+    try:
+        value = CASTS[res_type](op(*values))
+    except Exception:
+        return None
+    if res_type == 'INT_T' and not INT64_MIN <= value <= INT64_MAX:
+        return None
+    return value
+
+def is_identity(op_name, const_value, var_type, right=True):
+    """
+    Whether x op_name const_value (or const_value op_name x when not right) is x for an x of var_type.
+    """
+    identities = RIGHT_IDENTITIES if right else LEFT_IDENTITIES
+    if op_name not in identities or type(const_value) == bool or const_value != identities[op_name]:
+        return False
+    return op_name not in INT_ONLY_IDENTITIES or var_type in ('INT_T', 'GPU_INT_T')
@@ -1,20 +1,33 @@
 from .semantic_cube import SemanticCube
 from .var_dir import FuncDir
 from .quadruples import Quadruple
+from . import binary_ir
+from .. import optimizer
 import json
 
 class ParseContext():
-    def __init__(self):
+    def __init__(self, check_bounds=False):
         self.func_dir = FuncDir()
         self.semantic_cube = SemanticCube()
         self._quadruples: list[Quadruple] = []
+        # when set every tensor access checks its indexes, even the ones proven in bounds
+        self.check_bounds = check_bounds
+        self.loop_bounds = {} # Var : value it is lower than in the body of the for loop it counts
+
+    def to_ir_repr(self):
+        return self.func_dir.to_ir_repr() | {"quads": [q.to_ir_repr() for q in self._quadruples]}
+
+    def optimize(self, inline=False):
+        return optimizer.optimize(self._quadruples, self.func_dir, inline)
 
     def output(self, file):
-        output = json.dumps(self.func_dir.to_ir_repr()
-        | {"quads": [q.to_ir_repr() for q in self._quadruples]})
+        output = json.dumps(self.to_ir_repr())
         with open(file, "w") as out_file:
             out_file.write(output)
 
+    def output_binary(self, file):
+        binary_ir.dump(self.to_ir_repr(), file)
+
     def get_quadruples(self):
         return self._quadruples
     
@@ -47,6 +47,7 @@ class Block():
         self.funcs: dict[str, Func] = {} # name : Func
         self.blocks: list[Block] = [] # Block
         self.temps: dict[str, Var] = {} # name : var
+        self.tens_temps: list[Tensor] = [] # tensor temps, including constant tensor literals
         self.consts = {
             'BOOL_T': {}, # val : var
             'INT_T': {}, # val : var
@@ -73,6 +74,8 @@ class Block():
             "GPU_FLOAT_T" : 0,
             "GPU_BOOL_T" : 0,
         }
+        self.tens_regions: dict[str, list] = {} # type : [[first var_num, size], ...]
+        self.tens_consts: dict[str, list] = {} # type : [[flat values, mem_dir], ...]
         self.id = Block._ID_COUNTER; Block._ID_COUNTER += 1
     
     def __repr__(self):
@@ -85,9 +88,16 @@ class Block():
         var_counter[type] += offset
         return new_mem_dir
 
+    def get_new_tens_memdir(self, type, size):
+        # Tensors are tracked so the vm knows which memory stores tensors and which scalars
+        new_mem_dir = self.get_new_memdir(type, size)
+        self.tens_regions.setdefault(type, []).append([new_mem_dir[1], size])
+        return new_mem_dir
+
     def self_to_ir_repr(self):
         consts_ir_repr = {k: [(k, v.to_ir_repr()) for k, v in v.items()] for k, v in self.consts.items()}
-        return [self.cpu_var_counter, consts_ir_repr, self.gpu_var_counter] # (# vars, consts table)
+        # (# vars, consts table, # gpu vars, tensor regions, constant tensors table)
+        return [self.cpu_var_counter, consts_ir_repr, self.gpu_var_counter, self.tens_regions, self.tens_consts]
     
     def to_ir_repr(self):
         curr_func = {self.id: self.self_to_ir_repr()}
@@ -165,24 +175,10 @@ class FuncDir:
             raise ParhlException(f"Id '{name}' already declared in this scope")
         # Obtain location of next memory of specified type
         m0 = reduce((lambda x, y: x*y), rs)
-        size = len(rs)
-        dims =[{}] * size
-        m = m0
-        for i, r in enumerate(rs):
-            m = m//r
-            dims[i] = {
-                'n': r, #For semantic validation
-                'limit': self.get_or_new_const('INT_T', r),
-                'm':  self.get_or_new_const('INT_T', m),
-            }
-        base_mem_dir = self.curr_scope.get_new_memdir(type, m0)
-        addr_vars = [
-            self.get_or_new_const("INT_T", base_mem_dir[0]),
-            self.get_or_new_const("INT_T", base_mem_dir[1]),
-            self.get_or_new_const("INT_T", base_mem_dir[2]),
-            self.get_or_new_const("INT_T", type_token_to_mem_id[type]),
-        ]
-        var = Tensor(name, type, base_mem_dir, addr_vars, dims=dims)
+        # Accesses get the limits and strides from the dims, the vm computes the address with the INDEX quad
+        dims = [{'n': r} for r in rs]
+        base_mem_dir = self.curr_scope.get_new_tens_memdir(type, m0)
+        var = Tensor(name, type, base_mem_dir, dims=dims)
         self.curr_scope.vars[name] = var
         return var
 
@@ -204,21 +200,31 @@ class FuncDir:
         self.func_stack[-1].consts[type][value] = var
         return var
         
-    def new_temp(self, type):
-        temp_var_name = type + str(self.curr_scope.temp_counters[type])
-        temp_var = Var(temp_var_name, type, self.curr_scope.get_new_memdir(type))
-        self.curr_scope.temps[temp_var_name] = temp_var
-        self.curr_scope.temp_counters[type] += 1
+    def new_temp(self, type, scope=None):
+        # the optimizer gives scope to create temps in blocks other than the current one
+        scope = scope or self.curr_scope
+        temp_var_name = type + str(scope.temp_counters[type])
+        temp_var = Var(temp_var_name, type, scope.get_new_memdir(type))
+        scope.temps[temp_var_name] = temp_var
+        scope.temp_counters[type] += 1
         return temp_var
     
     def new_tens_const(self, type, mem_dirs, dims):
         return TensorConst("TENS_CONST", type,  mem_dirs, dims)
 
-    def new_tens_temp(self, type, dims):
-        temp_var_name = "TENS_" + type + str(self.curr_scope.temp_counters[type])
+    def new_tens_literal(self, type, values, dims):
+        # Tensor literal with only constant values, stored as a flat array in the constant tensors table
+        tens_temp = self.new_tens_temp(type, dims)
+        self.curr_scope.tens_consts.setdefault(type, []).append([values, tens_temp.mem_dir])
+        return tens_temp
+
+    def new_tens_temp(self, type, dims, scope=None):
+        scope = scope or self.curr_scope
+        temp_var_name = "TENS_" + type + str(scope.temp_counters[type])
         total_vars = reduce(lambda x, y: x*y, dims)
         dims_dict = [{'n': dim} for dim in dims]
-        temp_var = Tensor(temp_var_name, type, self.curr_scope.get_new_memdir(type, total_vars), dims=dims_dict)
+        temp_var = Tensor(temp_var_name, type, scope.get_new_tens_memdir(type, total_vars), dims=dims_dict)
+        scope.tens_temps.append(temp_var)
         return temp_var
 
     def _find_in_ordered_scopes(self, name, attr):
@@ -0,0 +1,58 @@
+import json
+import pytest
+from ..structs import binary_ir
+from ..structs.parhl_exceptions import ParhlException
+from .test_optimizer import compile_ctx
+from virtual_machine.interpreter import run_global
+
+def test_binary_ir_round_trip(tmp_path):
+    with open("./code_tests/tensor-IO-test.out", 'r') as ir_file:
+        ir = json.load(ir_file)
+    binary_ir.dump(ir, tmp_path / "tensor-IO-test.pbc")
+    func_dir, quads = binary_ir.load(tmp_path / "tensor-IO-test.pbc")
+    assert func_dir == ir["func_dir"]
+    assert len(quads) == len(ir["quads"])
+    assert [quads[i] for i in reversed(range(len(quads)))] == ir["quads"][::-1]
+
+def test_binary_ir_index_operands(tmp_path, capsys, monkeypatch):
+    # the indexes of INDEX are a list of mem_dirs, with 2 of them it has the shape of a tensor operand
+    ctx = compile_ctx("""
+let a[2][3] : int := [[1,2,3],[4,5,6]]
+let i : int := 1
+a[i][2] := a[0][i] + a[i][i]
+print(a, "\\n")
+print(a[i][3])
+""", monkeypatch)
+    ir = json.loads(json.dumps(ctx.to_ir_repr()))
+    assert any(q[0] == "INDEX" and len(q[2]) == 2 for q in ir["quads"])
+    binary_ir.dump(ir, tmp_path / "index.pbc")
+    func_dir, quads = binary_ir.load(tmp_path / "index.pbc")
+    assert list(quads) == ir["quads"]
+    with pytest.raises(Exception, match="INDEX") as error:
+        run_global(func_dir, quads, lazy=True)
+    assert str(error.value.__cause__) == "Out of bounds: tensor index with value 3 must be lower than 3"
+    assert capsys.readouterr().out == "[[1, 2, 3], [4, 5, 7]]\n"
+
+def test_binary_ir_fused_operands(tmp_path, capsys, monkeypatch):
+    ctx = compile_ctx("""
+let a[2][2] : float := [[1.0, 2.0], [3.0, 4.0]]
+let c[2] : int := [1, 2]
+let x : int := 3
+print(-a * c + a / x - c % 2, "\\n")
+""", monkeypatch)
+    ctx.optimize()
+    ir = json.loads(json.dumps(ctx.to_ir_repr()))
+    assert [q[0] for q in ir["quads"]].count("FUSED") == 1
+    binary_ir.dump(ir, tmp_path / "fused.pbc")
+    func_dir, quads = binary_ir.load(tmp_path / "fused.pbc")
+    assert list(quads) == ir["quads"]
+    run_global(func_dir, quads, lazy=True)
+    assert capsys.readouterr().out == "[[-1.6666666666666667, -3.3333333333333335], [-3.0, -6.666666666666667]]\n"
+
+def test_binary_ir_constants_out_of_range(tmp_path, monkeypatch):
+    ctx = compile_ctx("""
+let x : int := 99999999999999999999
+print(x)
+""", monkeypatch)
+    with pytest.raises(ParhlException, match="99999999999999999999 does not fit in the INT_T"):
+        binary_ir.dump(ctx.to_ir_repr(), tmp_path / "big.pbc")
@@ -0,0 +1,18 @@
+import os
+from .. import compile_cache
+
+def test_compile_cache_lru(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_cache, "COMPILE_CACHE_DIR", str(tmp_path / "compiled"))
+    ir_file = tmp_path / "prog.out"
+    keys = [compile_cache.cache_key(f"print({i})".encode(), "json") for i in range(3)]
+    assert len(set(keys)) == 3
+    assert compile_cache.cache_key(b"print(0)", "binary") != keys[0]
+    for i, key in enumerate(keys):
+        ir_file.write_text(f"ir {i}")
+        compile_cache.store(key, ir_file)
+        os.utime(os.path.join(compile_cache.COMPILE_CACHE_DIR, key), (i, i))
+    assert compile_cache.fetch(keys[0], ir_file) # keys[0] becomes the most recently used
+    assert ir_file.read_text() == "ir 0"
+    compile_cache.evict(max_bytes=2 * len("ir 0"))
+    assert not compile_cache.fetch(keys[1], ir_file)
+    assert compile_cache.fetch(keys[0], ir_file) and compile_cache.fetch(keys[2], ir_file)
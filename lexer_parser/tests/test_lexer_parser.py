@@ -1,7 +1,12 @@
+import os
+import pickle
+import subprocess
+import sys
 import pytest
 from ..lexer import ParhlLexer
 from ..parser import ParhlParser
 from ..structs.parse_context import ParseContext
+from .. import parser_tables
 
 """FIXTURES AND HELPERS"""
 def write_tokens_to_file_testing(toks_file, out_file):
@@ -55,3 +60,34 @@ def test_parser_func_dir(data_out_parser_func_dir, capfd):
     print(ctx.func_dir)
     out, _ = capfd.readouterr()
     assert out == out_parser
+
+def test_parser_tables_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser_tables, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(ParhlParser, "_lrtable", ParhlParser._lrtable)
+    lr_action = ParhlParser._lrtable.lr_action
+    assert parser_tables.build_lrtables(ParhlParser) # built and stored
+    assert os.path.exists(parser_tables.tables_file(ParhlParser))
+    assert parser_tables.build_lrtables(ParhlParser) # loaded
+    assert type(ParhlParser._lrtable) == parser_tables.CachedLRTable
+    assert ParhlParser._lrtable.lr_action == lr_action
+
+# a pickle of a class whose module does not exist
+FOREIGN_PICKLE = pickle.dumps(parser_tables.CachedLRTable({}, {}, {}, [], [])).replace(
+    b"lexer_parser.parser_tables", b"parhl_gone.parser_tables__")
+
+@pytest.mark.parametrize("content", [b"", b"not a pickle", pickle.dumps(42), FOREIGN_PICKLE],
+    ids=["empty", "not a pickle", "not tables", "missing module"])
+def test_parser_tables_bad_cache(tmp_path, content):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    with open(cache_dir / os.path.basename(parser_tables.tables_file(ParhlParser)), "wb") as tables:
+        tables.write(content)
+    source = tmp_path / "prog.parhl"
+    source.write_text('let x : int := 1\nprint(x)\n')
+    # sly builds the tables once per process, the compiler runs in its own
+    subprocess.run([sys.executable, "parhl_comp", "--no-cache", str(source)], check=True,
+        env=os.environ | {"PARHL_CACHE_DIR": str(cache_dir)})
+    assert (tmp_path / "prog.out").exists()
+    # the bad file is overwritten with the tables
+    with open(cache_dir / os.path.basename(parser_tables.tables_file(ParhlParser)), "rb") as tables:
+        assert type(pickle.load(tables)) == parser_tables.CachedLRTable
@@ -0,0 +1,303 @@
+import pytest
+from ..lexer import ParhlLexer
+from ..parser import ParhlParser
+from ..structs.parse_context import ParseContext
+from ..structs.var_dir import Block
+from virtual_machine.interpreter import run_global
+
+"""FIXTURES AND HELPERS"""
+PROGRAM = """
+let fib(n : int) : int {
+    if(n <= 1){
+        return n
+    }
+    return fib(n-1) + fib(n-2)
+}
+let a[3][2] : int := [[1,2],[3,4],[5,6]]
+let s : int := fib(10)
+for(let i : int := 0; i < 3; i := i + 1){
+    let x : int := a[i][1] * 2
+    s := s + x
+    a[i][0] := fib(i) + x
+}
+print(s, "\\n", a, "\\n")
+"""
+
+def compile_ctx(code, monkeypatch):
+    monkeypatch.setattr(Block, "_ID_COUNTER", 0)
+    ctx = ParseContext()
+    ParhlParser().parse(ParhlLexer().tokenize(code)).gen(ctx)
+    return ctx
+
+def run_ctx(ctx, capsys):
+    ir = ctx.to_ir_repr()
+    run_global(ir["func_dir"], ir["quads"])
+    out, _ = capsys.readouterr()
+    return out
+
+"""TESTS"""
+def test_peephole(monkeypatch, capsys):
+    expected = run_ctx(compile_ctx(PROGRAM, monkeypatch), capsys)
+    ctx = compile_ctx(PROGRAM, monkeypatch)
+    n_quads = len(ctx.get_quadruples())
+    stats = ctx.optimize()
+    quads = ctx.get_quadruples()
+    assert stats["peephole"] > 0 and len(quads) == n_quads - stats["peephole"]
+    # the return var of fib is read directly, only fib(n-1) in fib(n-1) + fib(n-2) is still copied to a temp
+    fib_var = ctx.func_dir.get_func("fib").func_var.mem_dir
+    copies = [q for q in quads if q.op == "ASSIG" and q.arg_1 == fib_var]
+    assert len(copies) == 2 and copies[1].result == ctx.func_dir.get_var("s").mem_dir
+    # fib's code starts right after the GOTO which skips it
+    assert quads[ctx.func_dir.get_func("fib").q_index - 1].op == "GOTO"
+    assert run_ctx(ctx, capsys) == expected
+
+def test_const_folding(monkeypatch, capsys):
+    ctx = compile_ctx("""
+let x : int := 5
+let d : float := 3 * 5 ^ 2 / 2.5
+let c : int := -7 / 2
+let t[2][2] : int := [[1,2],[3,4]]
+let u[2][2] : int := 1 * t ^ 1 + 0
+print(d, " ", c, " ", x * 1 - 0, " ", u, "\\n")
+""", monkeypatch)
+    quads = ctx.get_quadruples()
+    assert [q.op for q in quads] == ["ASSIG"] * 3 + ["COPY"] * 2 + ["PRINT"] * 8
+    assert run_ctx(ctx, capsys) == "30.0 -3 5 [[1, 2], [3, 4]]\n"
+    # out of the int64 range, the vm computes it and wraps it around
+    ctx = compile_ctx("""
+let w : int := 2 ^ 70
+print(w, "\\n")
+""", monkeypatch)
+    assert "EXP" in [q.op for q in ctx.get_quadruples()]
+    assert run_ctx(ctx, capsys) == "0\n"
+
+def test_slot_reuse(monkeypatch, capsys):
+    program = PROGRAM + """
+let m[2][2] : float := [[1.5, 2.0], [0.5, 1.0]]
+let r[2][2] : float := (m ** m) * 2 + m - m / 4
+print(r, " ", m[1][0] + m[0][1] * 2, "\\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    frame = dict(ctx.func_dir.glob_func.cpu_var_counter)
+    stats = ctx.optimize()
+    assert stats["slot_reuse"] > 0
+    assert sum(ctx.func_dir.glob_func.cpu_var_counter.values()) < sum(frame.values())
+    assert run_ctx(ctx, capsys) == expected
+
+def test_bounds_check_elimination(monkeypatch, capsys):
+    program = """
+let a[3][2] : int := [[1,2],[3,4],[5,6]]
+let s : int := 0
+for(let i : int := 0; i <= 2; i := i + 1){
+    for(let j : int := 0; j < 2; j := j + 1){
+        s := s + a[i][j]
+    }
+    a[i][1] := a[i][0] + a[2 - i][1]
+}
+for(let i : int := 0; i < 2; i := i + 1){
+    i := i + 1
+    s := s + a[i][0]
+}
+print(s, " ", a, "\\n")
+"""
+    ops = lambda ctx: [q.op for q in ctx.get_quadruples() if q.op.endswith("INDEX")]
+    ctx = compile_ctx(program, monkeypatch)
+    # a[2 - i] and the accesses of the loop assigning its own var keep the check
+    assert ops(ctx) == ["UNCHECKED_INDEX"] * 2 + ["INDEX", "UNCHECKED_INDEX", "INDEX"]
+    assert run_ctx(ctx, capsys) == "24 [[1, 7], [3, 7], [5, 12]]\n"
+    monkeypatch.setattr(Block, "_ID_COUNTER", 0)
+    ctx = ParseContext(check_bounds=True)
+    ParhlParser().parse(ParhlLexer().tokenize(program)).gen(ctx)
+    assert ops(ctx) == ["INDEX"] * 5
+
+def test_licm(monkeypatch, capsys):
+    program = """
+let a[2][2] : float := [[1.0, 2.0], [3.0, 4.0]]
+let b[2][2] : int := [[1, 2], [3, 4]]
+let n : int := 2
+let s : float := 0.0
+for(let i : int := 0; i < n * 2; i := i + 1){
+    let c[2][2] : float := a ** a + a
+    let d[2][2] : int := b ** b
+    s := s + c[1][0] + d[0][1] + n * 3
+    b[0][0] := b[0][0] + i
+}
+print(s, " ", b, "\\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    stats = ctx.optimize()
+    quads = ctx.get_quadruples()
+    loop_start = next(i for i, q in enumerate(quads) if q.op == "GOTOF")
+    # n * 2, a ** a + a, n * 3 and the 3 accesses left by cse (pointers do not change) run once,
+    # b ** b stays since b changes in the loop
+    assert stats["licm"] == 7
+    assert [q.op for q in quads[:loop_start] if q.op in ("MMULT", "MULT")] == ["MULT", "MMULT", "MULT"]
+    assert [q.op for q in quads[loop_start:] if q.op == "MMULT"] == ["MMULT"]
+    assert run_ctx(ctx, capsys) == expected
+
+def test_cse(monkeypatch, capsys):
+    program = """
+let a[3][3] : int := [[1,2,3],[4,5,6],[7,8,9]]
+let x[2][2] : float := [[1.0, 2.0], [3.0, 4.0]]
+let w[2][2] : float := [[0.5, 0.0], [1.0, 2.0]]
+let i : int := 1
+let j : int := 2
+let s : int := a[i][j] * a[i][j] + a[i][j]
+let y[2][2] : float := (x ** w) + (x ** w)
+a[i][j] := a[i][j] + 1
+let r : int := a[i][j] * 2 + a[i][j] + i * j + j * i
+print(s, " ", y, " ", r, " ", "a" + "b", " ", "b" + "a", "\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    stats = ctx.optimize()
+    quads = ctx.get_quadruples()
+    # every access reuses the first pointer, the value it points to is read again after the write through it
+    assert stats["cse"] > 0 and [q.op for q in quads].count("INDEX") == 1
+    assert [q.op for q in quads].count("MMULT") == 1
+    assert run_ctx(ctx, capsys) == expected == "42 [[5.0, 8.0], [11.0, 16.0]] 25 ab ba\n"
+
+def test_inline(monkeypatch, capsys):
+    program = """
+let clamp(x : int, hi : int) : int {
+    if(x > hi) {
+        return hi
+    }
+    return x
+}
+let twice(x : int) : int {
+    return clamp(x, 5) * 2
+}
+let fact(n : int) : int {
+    if(n <= 1) {
+        return 1
+    }
+    return n * fact(n - 1)
+}
+let s : int := 0
+for(let i : int := 0; i < 8; i := i + 1){
+    s := s + twice(i)
+}
+print(s, " ", fact(5), "\\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    assert "inline" not in ctx.optimize()
+    assert [q.op for q in ctx.get_quadruples()].count("GOSUB") == 4
+    ctx = compile_ctx(program, monkeypatch)
+    stats = ctx.optimize(inline=True)
+    gosubs = [q for q in ctx.get_quadruples() if q.op == "GOSUB"]
+    # clamp is inlined in twice, then twice in the loop, fact calls itself
+    assert stats["inline"] == 2
+    assert len(gosubs) == 2 and all(q.result == ctx.func_dir.glob_func.funcs["fact"].id for q in gosubs)
+    assert run_ctx(ctx, capsys) == expected == "50 120\n"
+
+def test_tco(monkeypatch, capsys):
+    program = """
+let sum(n : int, acc : int) : int {
+    if(n = 0) {
+        return acc
+    }
+    return sum(n - 1, acc + n)
+}
+let swap(a : int, b : int, k : int) : int {
+    if(k = 0) {
+        return a * 10 + b
+    }
+    return swap(b, a, k - 1)
+}
+let fact(n : int) : int {
+    if(n <= 1) {
+        return 1
+    }
+    return n * fact(n - 1)
+}
+print(sum(100, 0), " ", swap(1, 2, 3), " ", fact(5), "\\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    stats = ctx.optimize()
+    funcs = ctx.func_dir.glob_func.funcs
+    gosubs = [q.result for q in ctx.get_quadruples() if q.op == "GOSUB"]
+    # the recursive calls of sum and swap jump back to their start, fact multiplies after its call
+    assert stats["tco"] == 2
+    assert sorted(gosubs) == sorted([funcs["sum"].id, funcs["swap"].id, funcs["fact"].id, funcs["fact"].id])
+    assert run_ctx(ctx, capsys) == expected == "5050 21 120\n"
+
+def test_vectorized_loops(monkeypatch, capsys):
+    program = """
+let a[5] : int := [1, 2, 3, 4, 5]
+let b[5] : int := [10, 20, 30, 40, 50]
+let c[5] : int
+let f[4] : float := [0.5, 1.5, 2.5, 3.5]
+let g[2] : float
+let k : int := 3
+let z : float := 0.0
+for(let i : int := 0; i < 5; i := i + 1){
+    c[i] := a[i] * b[i] + 1
+    a[i] := c[i] - a[i] * k
+}
+for(let i : int := 0; i < 3; i := i + 1){
+    f[i] := f[i] / 2 + a[i] % 7
+}
+for(let i : int := 0; i < 5; i := i + 1){
+    b[i] := b[i] / k
+}
+for(let i : int := 0; i < 2; i := i + 1){
+    g[i] := (f[i] - 1.25) / z
+}
+print(a, " ", c, " ", f, " ", b, " ", g, "\\n")
+"""
+    ctx = compile_ctx(program, monkeypatch)
+    quads = ctx.get_quadruples()
+    # the loops run as tensor ops on the first n elements, a 0 divisor gives the values of the loop
+    assert not any(q.op in ("GOTOF", "INDEX", "UNCHECKED_INDEX") for q in quads)
+    assert [q.op for q in quads if q.op in ("MULT", "PLUS", "MINUS", "DIV", "MOD")] == \
+        ["MULT", "PLUS", "MULT", "MINUS", "DIV", "MOD", "PLUS", "DIV", "MINUS", "DIV"]
+    assert [q.arg_1[1] for q in quads if q.op == "DIV"] == [[3], [5], [2]]
+    expected = "[8, 35, 82, 149, 236] [11, 41, 91, 161, 251] [1.25, 0.75, 6.25, 3.5] [3, 6, 10, 13, 16] [nan, -inf]\n"
+    assert run_ctx(ctx, capsys) == expected
+
+def test_fusion(monkeypatch, capsys):
+    program = """
+let a[2][3] : float := [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+let b[2][3] : float := [[0.5, 1.5, 2.5], [3.5, 4.5, 5.5]]
+let c[3] : int := [1, 2, 3]
+let d[2][3] : int := [[7, 8, 9], [10, 11, 12]]
+let p[3] : bool := [True, False, True]
+let q[3] : bool := [False, False, True]
+let x : int := 3
+let e[2][3] : float := a + b * c - a / 2
+let f[2][3] : float := a * b + c * a - -b
+let g[2][3] : int := d / 4 + d % x * c
+let m[3] : bool := not p and q or p
+print(e, " ", f, " ", g, " ", m, " ", (d / x) * a, "\\n")
+"""
+    expected = run_ctx(compile_ctx(program, monkeypatch), capsys)
+    ctx = compile_ctx(program, monkeypatch)
+    stats = ctx.optimize()
+    kernels = [q for q in ctx.get_quadruples() if q.op == "FUSED"]
+    # every expression is one kernel
+    assert stats["fusion"] == 3 + 4 + 3 + 2 + 1
+    assert [[step[0] for step in q.arg_2] for q in kernels] == [
+        ["DIV", "MULT", "PLUS", "MINUS"],
+        ["MINUS", "MULT", "MULT", "PLUS", "MINUS"],
+        ["MOD", "MULT", "DIV", "PLUS"],
+        ["NOT", "AND", "OR"],
+        ["DIV", "MULT"],
+    ]
+    # the int division of g is stored as an int before the sum, like in its temp
+    assert run_ctx(ctx, capsys) == expected == "[[1.0, 4.0, 9.0], [5.5, 11.5, 19.5]] " \
+        "[[2.0, 8.5, 19.0], [21.5, 37.0, 56.5]] [[2, 6, 2], [3, 6, 3]] [True, False, True] " \
+        "[[2.0, 4.0, 9.0], [12.0, 15.0, 24.0]]\n"
+    # the result of a 1 element kernel does not share the slot of an input it reads after its first step
+    ctx = compile_ctx("""
+let m[1][1] : int := [[2]]
+let r[1][1] : int := (m ** m) * [[3]] + (m ** m)
+print(r, "\\n")
+""", monkeypatch)
+    ctx.optimize()
+    assert any(q.op == "FUSED" for q in ctx.get_quadruples())
+    assert run_ctx(ctx, capsys) == "[[16]]\n"
@@ -0,0 +1,220 @@
+import operator
+import torch
+from .memory import GPU_TYPES, MemoryManager, identity
+from .output import Output
+from .operations import (bin_op_tens, bin_op_string_tens, bin_op_reg, un_op_tens, un_op_reg,
+    assig_op, copy_op, param_op, verify_op, index_op, unchecked_index_op,
+    fused_op, OUT_BIN_OPS, OUT_UN_OPS, read_line_op, read_file_op, write_to_file, print_tens_op, print_reg_op,
+    matmul_long, matmul_double, matrix_power_double, scalar_div, scalar_mod, scalar_pow,
+    all_eq, all_not_eq, all_geqt, all_leqt, all_gt, all_lt)
+
+# op_name : (regular op, tensor op), a None tensor op means the regular op also works on tensors
+BIN_OPS = {
+    "PLUS" : (operator.add, None),
+    "MINUS" : (operator.sub, None),
+    "DIV" : (scalar_div, operator.truediv),
+    "MULT" : (operator.mul, None),
+    "MOD" : (scalar_mod, operator.mod),
+    "GEQT" : (operator.ge, all_geqt),
+    "LEQT" : (operator.le, all_leqt),
+    "GT" : (operator.gt, all_gt),
+    "LT" : (operator.lt, all_lt),
+    "OR" : (operator.or_, None),
+    "AND" : (operator.and_, None),
+}
+COMPARE_OPS = {
+    "EQ" : (operator.eq, all_eq),
+    "NOT_EQ" : (operator.ne, all_not_eq),
+}
+# op_name : (regular op, tensor op)
+UN_OPS = {
+    "PLUS" : (identity, None),
+    "MINUS" : (operator.neg, None),
+    "NOT" : (operator.not_, operator.invert),
+}
+SIMPLE_OPS = {
+    "ASSIG" : assig_op,
+    "COPY" : copy_op,
+    "PARAM" : param_op,
+    "VERIFY" : verify_op,
+    "INDEX" : index_op,
+    "UNCHECKED_INDEX" : unchecked_index_op,
+    "FUSED" : fused_op,
+    "READ_FILE" : read_file_op,
+    "WRITE_FILE" : write_to_file,
+}
+
+def _is_tens(operand):
+    return len(operand) == 2
+
+def _decode_arith(q, mem, nxt):
+    """
+    Picks the operation implementation once, based on the shape of the operands
+    (unary/binary, tensor/regular, string tensors) and the result type.
+    """
+    q_op = q[0]
+    if q_op in UN_OPS and q[2] == None:
+        reg_op, tens_op = UN_OPS[q_op]
+        if _is_tens(q[1]):
+            return un_op_tens(q, mem, tens_op or reg_op, nxt, OUT_UN_OPS.get(q_op))
+        return un_op_reg(q, mem, reg_op, nxt)
+    if q_op == "MMULT":
+        if not _is_tens(q[1]):
+            return bin_op_reg(q, mem, operator.mul, nxt)
+        is_int_res = q[3][3] == 1 or q[3][3] == 4 # if result is INT_T or GPU_INT_T
+        return bin_op_tens(q, mem, matmul_long if is_int_res else matmul_double, nxt)
+    if q_op == "EXP":
+        if not _is_tens(q[1]):
+            return bin_op_reg(q, mem, scalar_pow, nxt)
+        is_gpu_int = q[1][0][3] == 4
+        return bin_op_tens(q, mem, matrix_power_double if is_gpu_int else torch.matrix_power, nxt)
+    if q_op in COMPARE_OPS:
+        reg_op, tens_op = COMPARE_OPS[q_op]
+        if not _is_tens(q[1]):
+            return bin_op_reg(q, mem, reg_op, nxt)
+        if q[1][0][3] == 0: # STRING_T, using reg op to execute item by item
+            return bin_op_string_tens(q, mem, reg_op, nxt)
+        return bin_op_tens(q, mem, tens_op, nxt)
+    reg_op, tens_op = BIN_OPS[q_op]
+    if _is_tens(q[1]):
+        return bin_op_tens(q, mem, tens_op or reg_op, nxt, OUT_BIN_OPS.get(q_op))
+    return bin_op_reg(q, mem, reg_op, nxt)
+
+def _decode_print(q, mem, out, nxt):
+    if _is_tens(q[3]): # tensor dims provided
+        return print_tens_op(q, mem, out, nxt)
+    return print_reg_op(q, mem, out, nxt)
+
+# op_name : handler builder of the ops which use the output of the program
+OUTPUT_OPS = {
+    "PRINT" : _decode_print,
+    "READ_LINE" : read_line_op,
+}
+
+def _decode_flow(q, mem, calls, blocks, nxt):
+    """
+    calls holds (return index, func id, # of open blocks) for every active GOSUB and
+    blocks the ids of the open blocks, the interpreter loop never recurses.
+    """
+    q_op = q[0]
+    if q_op == "GOTO":
+        target = q[3]
+        return lambda: target
+    if q_op == "GOTOF":
+        get_cond, target = mem.reader(q[1]), q[3]
+        if q[1][3] in GPU_TYPES: # the host waits for the device to compute the condition
+            def gotof():
+                mem.syncs += 1
+                return nxt if get_cond() else target
+            return gotof
+        return lambda: nxt if get_cond() else target
+    if q_op == "STRTBLK":
+        fid = q[3]
+        def strtblk():
+            mem.era_func_stack(fid)
+            mem.start_func_stack(fid)
+            blocks.append(fid)
+            return nxt
+        return strtblk
+    if q_op == "ENDBLK":
+        fid = q[3]
+        def endblk():
+            mem.end_func_stack(fid)
+            blocks.pop()
+            return nxt
+        return endblk
+    if q_op == "ERA":
+        fid = q[3]
+        def era():
+            mem.era_func_stack(fid)
+            return nxt
+        return era
+    if q_op == "GOSUB":
+        fid, q_index = q[3], q[1]
+        def gosub():
+            mem.start_func_stack(fid)
+            calls.append((nxt, fid, len(blocks)))
+            return q_index
+        return gosub
+    def end_func():
+        if not calls: # end of the global function
+            return None
+        ret_idx, fid, n_blocks = calls.pop()
+        # a RETURN inside blocks also closes them
+        while len(blocks) > n_blocks:
+            mem.end_func_stack(blocks.pop())
+        mem.end_func_stack(fid)
+        return ret_idx
+    if q_op == "RETURN":
+        assig = assig_op(q, mem, None)
+        def ret():
+            assig()
+            return end_func()
+        return ret
+    if q_op == "ENDFUNC":
+        return end_func
+
+FLOW_OPS = {"GOTO", "GOTOF", "STRTBLK", "ENDBLK", "ERA", "GOSUB", "RETURN", "ENDFUNC"}
+
+def decode(q, q_idx, mem: MemoryManager, calls, blocks, out: Output):
+    q_op, nxt = q[0], q_idx + 1
+    if q_op in FLOW_OPS:
+        return _decode_flow(q, mem, calls, blocks, nxt)
+    if q_op in OUTPUT_OPS:
+        return OUTPUT_OPS[q_op](q, mem, out, nxt)
+    if q_op in SIMPLE_OPS:
+        return SIMPLE_OPS[q_op](q, mem, nxt)
+    return _decode_arith(q, mem, nxt)
+
+def load_program(mem: MemoryManager, quads, out: Output, lazy=False):
+    """
+    Load phase of the VM, turns every quad into a pre-bound handler.
+    Handlers take no arguments and return the index of the next quad to execute,
+    or None when the program must stop.
+    When lazy, every quad is decoded the first time it executes.
+    """
+    calls, blocks = [], []
+    if lazy:
+        code = LazyCode(lambda q_idx: decode(quads[q_idx], q_idx, mem, calls, blocks, out))
+    else:
+        code = [decode(q, q_idx, mem, calls, blocks, out) for q_idx, q in enumerate(quads)]
+    # reaching the end of the quads ends the global function
+    if lazy:
+        code[len(quads)] = lambda: None
+    else:
+        code.append(lambda: None)
+    return code
+
+class LazyCode(dict):
+    """
+    Handlers by quad index, a quad is decoded the first time its handler is needed.
+    """
+    def __init__(self, decode_quad):
+        super().__init__()
+        self.decode_quad = decode_quad
+
+    def __missing__(self, q_idx):
+        handler = self[q_idx] = self.decode_quad(q_idx)
+        return handler
+
+def run(code, quads, q_idx):
+    try:
+        while q_idx is not None:
+            q_idx = code[q_idx]()
+    except Exception as e:
+        raise Exception(f"Error executing op: {q_idx} - {quads[q_idx]}") from e
+
+def run_global(func_dir, quads, device="cpu", lazy=False):
+    """
+    Runs the program, returns its memory manager and output, which hold the counts of transfers and syncs.
+    """
+    memory_manager, out = MemoryManager(func_dir, device), Output()
+    code = load_program(memory_manager, quads, out, lazy)
+    memory_manager.era_func_stack(0)
+    memory_manager.start_func_stack(0)
+    try:
+        run(code, quads, 0)
+    finally: # what was printed before an error too
+        out.flush()
+    memory_manager.end_func_stack(0)
+    return memory_manager, out
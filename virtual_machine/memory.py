@@ -0,0 +1,420 @@
+import torch
+
+# Mirrors type_token_to_mem_id in the lexer
+TYPE_MEM_IDS = {
+    'STRING_T' : 0,
+    'INT_T' : 1,
+    'FLOAT_T' : 2,
+    'BOOL_T' : 3,
+    'GPU_INT_T' : 4,
+    'GPU_FLOAT_T' : 5,
+    'GPU_BOOL_T' : 6,
+}
+# Types of the values in device memory, the rest are in host memory
+GPU_TYPES = {TYPE_MEM_IDS['GPU_INT_T'], TYPE_MEM_IDS['GPU_FLOAT_T'], TYPE_MEM_IDS['GPU_BOOL_T']}
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+def to_int64(val):
+    """
+    val cast like storing it in an int64 tensor, ints wrap around and floats out of its range (inf and nan
+    included) are cast by torch.
+    """
+    if INT64_MIN <= val <= INT64_MAX:
+        return int(val)
+    if isinstance(val, torch.Tensor): # ops on elements of float tensors
+        val = val.item()
+    if isinstance(val, float) or val != val:
+        return torch.tensor(val, dtype=torch.float64).long().item()
+    return (val - INT64_MIN) % 2**64 + INT64_MIN
+
+# Scalars of these CPU types live in plain python lists, their tensors in torch segments
+CPU_SCALAR_TYPES = {
+    1 : (to_int64, torch.int64), # INT_T
+    2 : (float, torch.float64), # FLOAT_T
+    3 : (bool, torch.bool), # BOOL_T
+}
+# value of the slots of segments 0-3 before anything is stored in them, declared vars are used unassigned
+SCALAR_DEFAULTS = ["", 0, 0.0, False]
+# Frame layout: segments 0-6 follow the mem id of each type (0 is for strings and pointers),
+# segments 7-9 hold the tensors of the CPU_SCALAR_TYPES
+TENS_SEGMENT_OFFSET = 6
+
+def tens_segment(tid):
+    return tid + TENS_SEGMENT_OFFSET if tid in CPU_SCALAR_TYPES else tid
+
+N_SEGMENTS = 10
+# Size of every arena segment when the vm starts, arenas double when exhausted
+INITIAL_ARENA_SIZE = 1024
+
+"""
+Handles memory allocation, setting and retreiving values from memory.
+Memory of every segment lives in a single arena which works as a stack, frames are
+windows of the arenas pushed on ERA/STRTBLK and popped on ENDFUNC/ENDBLK.
+"""
+class MemoryManager():
+    def __init__(self, func_dir, device="cpu"):
+        self.func_dir = func_dir
+        self.device = device
+        # tens_regions[func_id][type] = [(first var_num, last var_num + 1), ...]
+        self.tens_regions = [
+            {TYPE_MEM_IDS[type]: [(first, first + size) for first, size in regions]
+                for type, regions in func[3].items()}
+            for func in func_dir
+        ]
+        # frame_sizes[func_id][segment] = # of slots the function needs in the segment
+        self.frame_sizes = [self._frame_size(func_id) for func_id in range(len(func_dir))]
+        self.arenas = [[default] * INITIAL_ARENA_SIZE for default in SCALAR_DEFAULTS] + [
+            torch.empty(INITIAL_ARENA_SIZE, dtype=dtype, device=self.device)
+            for dtype in (torch.int64, torch.float64, torch.bool)
+        ] + [
+            torch.empty(INITIAL_ARENA_SIZE, dtype=dtype, device='cpu')
+            for _, dtype in CPU_SCALAR_TYPES.values()
+        ]
+        # top of every arena
+        self.stack_pointers = [0] * N_SEGMENTS
+        # bases[func_id * N_SEGMENTS + segment] = start of the active frame of func_id in the segment,
+        # the last entry is the base of the constants which stays at 0
+        self.bases = [0] * (N_SEGMENTS * len(func_dir) + 1)
+        self.const_key = len(self.bases) - 1
+        # mem_stack holds the bases of the inactive frames of every function (recursion, nested blocks)
+        self.mem_stack = [[] for _ in range(len(func_dir))]
+        # dormant_mem_stack holds the bases of frames for functions which are inactive
+        # i.e. which exist between an ERA and GOSUB state
+        self.dormant_mem_stack = [[] for _ in range(len(func_dir))]
+        # const_slots[(func_id, segment, var_num)] = position of the constant at the bottom of the arena
+        self.const_slots = {}
+        self._load_consts()
+        # device_copies[tens segment][(first slot, size)] = copy on the device of a host tensor, see device_tens_reader
+        self.device_copies = {tens_segment(tid): {} for tid in CPU_SCALAR_TYPES}
+        # tensors moved between the host and the device
+        self.transfers = 0
+        # device values the host waited for to decide a jump
+        self.syncs = 0
+
+    def _load_consts(self):
+        """
+        Constants of every function live once at the bottom of the arenas, shared by all frames.
+        """
+        for fid, func in enumerate(self.func_dir):
+            for _, consts in func[1].items():
+                for val, (_, idx, _, tid) in consts:
+                    seg = self.segment_of(fid, idx, tid)
+                    pos = self._push_consts(seg, 1)
+                    self.arenas[seg][pos] = CPU_SCALAR_TYPES[tid][0](val) if seg in CPU_SCALAR_TYPES else val
+                    self.const_slots[(fid, seg, idx)] = pos
+            # tensor literals are copied at once
+            for _, tens_consts in func[4].items():
+                for vals, (_, idx, _, tid) in tens_consts:
+                    seg = self.segment_of(fid, idx, tid)
+                    pos = self._push_consts(seg, len(vals))
+                    arena = self.arenas[seg]
+                    arena[pos:pos+len(vals)] = vals if isinstance(arena, list) else torch.tensor(vals, dtype=arena.dtype)
+                    for i in range(len(vals)):
+                        self.const_slots[(fid, seg, idx + i)] = pos + i
+
+    def _push_consts(self, seg, size):
+        pos = self.stack_pointers[seg]
+        if pos + size > len(self.arenas[seg]):
+            self._grow_arena(seg, pos + size)
+        self.stack_pointers[seg] = pos + size
+        return pos
+
+    def _frame_size(self, func_id):
+        cpu_var_counters, gpu_var_counters = self.func_dir[func_id][0], self.func_dir[func_id][2]
+        # tensor literals live with the constants, outside of the frames
+        literals = {(mem_dir[3], mem_dir[1]) for tens_consts in self.func_dir[func_id][4].values() for _, mem_dir in tens_consts}
+        tens_sizes = {
+            tid: max((last for first, last in regions if (tid, first) not in literals), default=0)
+            for tid, regions in self.tens_regions[func_id].items()
+        }
+        return [
+            cpu_var_counters["STRING_T"],
+            cpu_var_counters["INT_T"],
+            cpu_var_counters["FLOAT_T"],
+            cpu_var_counters["BOOL_T"],
+            gpu_var_counters["GPU_INT_T"],
+            gpu_var_counters["GPU_FLOAT_T"],
+            gpu_var_counters["GPU_BOOL_T"],
+        ] + [tens_sizes.get(tid, 0) for tid in CPU_SCALAR_TYPES]
+
+    def segment_of(self, fid, idx, tid):
+        for first, last in self.tens_regions[fid].get(tid, []):
+            if first <= idx < last:
+                return tens_segment(tid)
+        return tid
+
+    def dereference(self, initial_mem_dir):
+        while(initial_mem_dir[2]):
+            fid, idx, _, tid = initial_mem_dir
+            segment, base = self.arenas[tid], self.bases[fid * N_SEGMENTS + tid]
+            initial_mem_dir = tuple(segment[base+idx+i] for i in range(4))
+        return initial_mem_dir
+
+    def _bind(self, mem_dir):
+        """
+        Resolves a non pointer mem_dir to (arena segment, key of its base in bases, offset).
+        """
+        fid, idx, _, tid = mem_dir
+        seg = self.segment_of(fid, idx, tid)
+        if (fid, seg, idx) in self.const_slots:
+            return self.arenas[seg], self.const_key, self.const_slots[(fid, seg, idx)]
+        return self.arenas[seg], fid * N_SEGMENTS + seg, idx
+
+    def locate(self, mem_dir):
+        segment, key, idx = self._bind(self.dereference(mem_dir))
+        return segment, self.bases[key] + idx
+
+    def get_mem(self, mem_dir, offset=None):
+        segment, idx = self.locate(mem_dir)
+        if offset is not None:
+            return segment[idx:idx+offset]
+        return segment[idx]
+
+    def set_mem_w_val(self, mem_dir_dst, val, offset=None):
+        mem_dir_dst = self.dereference(mem_dir_dst)
+        self._host_written(self.segment_of(mem_dir_dst[0], mem_dir_dst[1], mem_dir_dst[3]))
+        segment, idx = self.locate(mem_dir_dst)
+        cast = CPU_SCALAR_TYPES[mem_dir_dst[3]][0] if self.is_scalar(mem_dir_dst) else None
+        if offset is not None:
+            segment[idx:idx+offset] = map(cast, val.tolist()) if cast else val
+        else:
+            segment[idx] = cast(val) if cast else val
+
+    def set_dorm_mem_w_val(self, dorm_mem_dir_dst, val):
+        fid, idx, _, tid = self.dereference(dorm_mem_dir_dst)
+        seg = self.segment_of(fid, idx, tid)
+        self.arenas[seg][self.dormant_mem_stack[fid][-1][seg] + idx] = val
+
+    # Handles resolved at load time. Addresses which are not pointers are bound to the
+    # arena segment and the base of their function, so accessing them is just indexing the arena.
+    # Only pointers (dereference flag = 1) go through dereference on every access.
+    def is_scalar(self, mem_dir):
+        """
+        True when mem_dir is resolved at load time to a python scalar.
+        """
+        fid, idx, deref, tid = mem_dir
+        return not deref and tid in CPU_SCALAR_TYPES and self.segment_of(fid, idx, tid) == tid
+
+    def reader(self, mem_dir):
+        if mem_dir[2]:
+            return lambda: self.get_mem(mem_dir)
+        segment, key, idx = self._bind(mem_dir)
+        if key == self.const_key:
+            val = segment[idx]
+            if isinstance(val, torch.Tensor):
+                val = val.clone() # detached from the arena, which may be resized
+            return lambda: val
+        bases = self.bases
+        return lambda: segment[bases[key] + idx]
+
+    def writer(self, mem_dir):
+        if mem_dir[2]:
+            return lambda val: self.set_mem_w_val(mem_dir, val)
+        segment, key, idx = self._bind(mem_dir)
+        bases, tid = self.bases, mem_dir[3]
+        copies = self.device_copies.get(self.segment_of(mem_dir[0], mem_dir[1], tid))
+        if self.is_scalar(mem_dir):
+            # casts just like storing the value in a torch tensor of the type would
+            cast = CPU_SCALAR_TYPES[tid][0]
+            def write(val):
+                segment[bases[key] + idx] = cast(val)
+        elif copies is not None: # an element of a host tensor
+            def write(val):
+                copies.clear()
+                segment[bases[key] + idx] = val
+        else:
+            def write(val):
+                segment[bases[key] + idx] = val
+        return write
+
+    def dorm_writer(self, mem_dir):
+        fid, idx, deref, tid = mem_dir
+        if deref:
+            return lambda val: self.set_dorm_mem_w_val(mem_dir, val)
+        seg = self.segment_of(fid, idx, tid)
+        segment, dormant = self.arenas[seg], self.dormant_mem_stack[fid]
+        cast = CPU_SCALAR_TYPES[tid][0] if self.is_scalar(mem_dir) else identity
+        def write(val):
+            segment[dormant[-1][seg] + idx] = cast(val)
+        return write
+
+    def slice_reader(self, mem_dir, size):
+        if mem_dir[2]:
+            return lambda: self.get_mem(mem_dir, size)
+        segment, key, idx = self._bind(mem_dir)
+        bases = self.bases
+        def read():
+            first = bases[key] + idx
+            return segment[first:first+size]
+        return read
+
+    def tens_reader(self, mem_dir, dims):
+        """
+        Reader of a torch tensor with shape dims, scalars are wrapped in a 0-d tensor.
+        """
+        if self.is_scalar(mem_dir):
+            get_val, dtype = self.reader(mem_dir), CPU_SCALAR_TYPES[mem_dir[3]][1]
+            return lambda: torch.tensor(get_val(), dtype=dtype)
+        size = 1
+        for dim in dims:
+            size *= dim
+        get_slice = self.slice_reader(mem_dir, size)
+        return lambda: get_slice().view(dims)
+
+    def slice_writer(self, mem_dir):
+        if mem_dir[2]:
+            return lambda vals, size: self.set_mem_w_val(mem_dir, vals, size)
+        segment, key, idx = self._bind(mem_dir)
+        bases, tid = self.bases, mem_dir[3]
+        copies = self.device_copies.get(self.segment_of(mem_dir[0], mem_dir[1], tid))
+        if self.is_scalar(mem_dir):
+            cast = CPU_SCALAR_TYPES[tid][0]
+            def write(vals, size):
+                first = bases[key] + idx
+                segment[first:first+size] = map(cast, vals.tolist())
+        elif copies is not None: # a host tensor
+            def write(vals, size):
+                copies.clear()
+                first = bases[key] + idx
+                segment[first:first+size] = vals
+        else:
+            def write(vals, size):
+                first = bases[key] + idx
+                segment[first:first+size] = vals
+        return write
+
+    def slice_view(self, mem_dir, size):
+        """
+        Reader of the view of the size slots of a tensor region at mem_dir, for ops which write their result to it.
+        """
+        get_slice = self.slice_reader(mem_dir, size)
+        copies = self.device_copies.get(self.segment_of(mem_dir[0], mem_dir[1], mem_dir[3]))
+        if copies is None:
+            return get_slice
+        def view():
+            copies.clear()
+            return get_slice()
+        return view
+
+    # Residency of the host tensors, the ones of the CPU types. Ops with an operand in device memory run on the
+    # device, the host tensors they read are copied to the device once and the copy is read until the host
+    # memory is written or its frame released. Host and device memory are told apart by their type and not by
+    # their torch device, a program run with the cpu as its device moves (and counts) the same tensors.
+    def device_tens_reader(self, mem_dir, dims):
+        """
+        Reader of a torch tensor with shape dims on the device.
+        """
+        get_tens = self.tens_reader(mem_dir, dims)
+        if mem_dir[3] in GPU_TYPES:
+            return get_tens
+        if mem_dir[2] or self.is_scalar(mem_dir) or not dims: # scalars go along with the op
+            device = self.device
+            return lambda: get_tens().to(device)
+        segment, key, idx = self._bind(mem_dir)
+        copies, bases, device, size = self.device_copies[tens_segment(mem_dir[3])], self.bases, self.device, 1
+        for dim in dims:
+            size *= dim
+        def read():
+            first = bases[key] + idx
+            copy = copies.get((first, size))
+            if copy is None:
+                copy = copies[(first, size)] = segment[first:first+size].to(device)
+                self.transfers += 1
+            return copy.view(dims)
+        return read
+
+    def counted(self, fn):
+        """
+        fn counting a transfer every time it runs, for the handlers which move a device value to the host.
+        """
+        def run(*args):
+            self.transfers += 1
+            return fn(*args)
+        return run
+
+    def _host_written(self, seg):
+        copies = self.device_copies.get(seg)
+        if copies:
+            copies.clear()
+
+    def is_contiguous(self, mem_dir, size):
+        """
+        True when the size slots starting at mem_dir are consecutive in a single arena.
+        """
+        if mem_dir[2]:
+            return False
+        fid, idx, _, tid = mem_dir
+        segment, key, first = self._bind(mem_dir)
+        for i in range(1, size):
+            if self._bind((fid, idx + i, 0, tid)) != (segment, key, first + i):
+                return False
+        return True
+
+    def copier(self, origin_mem_dir, dest_mem_dir, size):
+        """
+        Copy of size consecutive slots, done with a single slice copy whenever both
+        sides are contiguous in the arenas.
+        """
+        if not (self.is_contiguous(origin_mem_dir, size) and self.is_contiguous(dest_mem_dir, size)):
+            fid, idx, deref, tid = origin_mem_dir
+            d_fid, d_idx, d_deref, d_tid = dest_mem_dir
+            pairs = [(self.reader((fid, idx + i, deref, tid)), self.writer((d_fid, d_idx + i, d_deref, d_tid)))
+                for i in range(size)]
+            def copy():
+                for get_val, set_val in pairs:
+                    set_val(get_val())
+            return copy
+        get_vals, set_vals = self.slice_reader(origin_mem_dir, size), self.slice_writer(dest_mem_dir)
+        dest_segment = self._bind(dest_mem_dir)[0]
+        if isinstance(self._bind(origin_mem_dir)[0], list) and isinstance(dest_segment, torch.Tensor):
+            dtype = dest_segment.dtype
+            return lambda: set_vals(torch.tensor(get_vals(), dtype=dtype), size)
+        origin_on_device, dest_on_device = origin_mem_dir[3] in GPU_TYPES, dest_mem_dir[3] in GPU_TYPES
+        if dest_on_device and not origin_on_device:
+            get_vals = self.device_tens_reader(origin_mem_dir, [size])
+        elif origin_on_device and not dest_on_device:
+            set_vals = self.counted(set_vals)
+        return lambda: set_vals(get_vals(), size)
+
+    def _grow_arena(self, seg, needed):
+        segment = self.arenas[seg]
+        new_size = max(2 * len(segment), needed)
+        # grown in place, handles keep a reference to the arena object
+        if isinstance(segment, list):
+            segment.extend([SCALAR_DEFAULTS[seg]] * (new_size - len(segment)))
+        else:
+            segment.resize_(new_size)
+
+    def malloc_dormant(self, func_id):
+        frame_bases = self.stack_pointers[:]
+        for seg, size in enumerate(self.frame_sizes[func_id]):
+            top = frame_bases[seg] + size
+            if top > len(self.arenas[seg]):
+                self._grow_arena(seg, top)
+            self.stack_pointers[seg] = top
+        self.dormant_mem_stack[func_id].append(frame_bases)
+        return self.dormant_mem_stack[func_id]
+
+    def era_func_stack(self, func_id):
+        # constants are not copied, they are read from the shared constant slots
+        self.malloc_dormant(func_id)
+
+    def start_func_stack(self, func_id):
+        first = func_id * N_SEGMENTS
+        self.mem_stack[func_id].append(self.bases[first:first+N_SEGMENTS])
+        self.bases[first:first+N_SEGMENTS] = self.dormant_mem_stack[func_id].pop()
+
+    def end_func_stack(self, func_id):
+        first = func_id * N_SEGMENTS
+        # frames are released in reverse order of allocation, the arenas shrink back to the frame start
+        self.stack_pointers = self.bases[first:first+N_SEGMENTS]
+        self.bases[first:first+N_SEGMENTS] = self.mem_stack[func_id].pop()
+        # the device copies of the tensors of released frames are dropped, the next frames reuse their slots
+        for seg, copies in self.device_copies.items():
+            if copies:
+                top = self.stack_pointers[seg]
+                for region in [region for region in copies if region[0] >= top]:
+                    del copies[region]
+
+def identity(x):
+    return x
@@ -0,0 +1,436 @@
+import operator
+from functools import reduce
+import torch
+from .memory import GPU_TYPES, MemoryManager, tens_segment
+from .output import Output
+
+"""
+Handler builders. Each one resolves the operands of a quad once, at load time, and
+returns a handler which executes the quad and returns the index of the next quad.
+"""
+
+def _size(dims):
+    return reduce(lambda x,y : x*y, dims + [1])
+
+def _dtype(mem: MemoryManager, tid):
+    return mem.arenas[tens_segment(tid)].dtype
+
+def _result_dtype(op, shapes, dtypes):
+    # ones of the same rank as the operands are promoted to the dtype torch gives the result
+    return op(*(torch.ones([1] * len(shape), dtype=dtype) for shape, dtype in zip(shapes, dtypes))).dtype
+
+def _tens_readers(mem: MemoryManager, opds):
+    """
+    Readers of the tensor operands and the device the op runs on, the device when an operand is in device memory.
+    """
+    if any(mem_dir[3] in GPU_TYPES for mem_dir, _ in opds):
+        return [mem.device_tens_reader(*opd) for opd in opds], mem.device
+    return [mem.tens_reader(*opd) for opd in opds], 'cpu'
+
+def _to_host(mem: MemoryManager, handler, opds, res_tid):
+    """
+    handler counting the transfer of its result when the op runs on the device and the result is in host memory.
+    """
+    if res_tid in GPU_TYPES or not any(mem_dir[3] in GPU_TYPES for mem_dir, _ in opds):
+        return handler
+    return mem.counted(handler)
+
+def _aliases(res_dir, res_size, opds):
+    """
+    If the result memory overlaps the memory of an operand, var numbers of a type are unique in a frame.
+    """
+    fid, idx, _, tid = res_dir
+    return any(mem_dir[0] == fid and mem_dir[3] == tid and mem_dir[1] < idx + res_size
+        and idx < mem_dir[1] + _size(dims) for mem_dir, dims in opds)
+
+def _out_reader(mem: MemoryManager, out_op, opds, res_dir, dev_to_use):
+    """
+    Reader of the view of the result memory out_op writes to, None when the result must be computed in a new
+    tensor and copied: the result is not in a torch arena, an operand is read through a pointer (its type id
+    is not the type of the element), the result overlaps an operand or torch gives the result another dtype or
+    device than its memory.
+    """
+    if out_op is None or res_dir[2] or any(mem_dir[2] for mem_dir, _ in opds):
+        return None
+    fid, idx, _, tid = res_dir
+    arena = mem.arenas[mem.segment_of(fid, idx, tid)]
+    if not isinstance(arena, torch.Tensor) or mem.is_scalar(res_dir):
+        return None
+    shapes, dtypes = [list(dims) for _, dims in opds], [_dtype(mem, mem_dir[3]) for mem_dir, _ in opds]
+    if arena.device.type != torch.device(dev_to_use).type or _result_dtype(out_op, shapes, dtypes) != arena.dtype:
+        return None
+    shape = list(torch.broadcast_shapes(*shapes))
+    if _aliases(res_dir, _size(shape), opds):
+        return None
+    # tensor temps are a single region of the arena
+    get_slice = mem.slice_view(res_dir, _size(shape))
+    return lambda: get_slice().view(shape)
+
+# op_name : torch op with an out= variant, the element-wise ops which write their result in place
+OUT_BIN_OPS = {
+    "PLUS" : torch.add,
+    "MINUS" : torch.sub,
+    "MULT" : torch.mul,
+    "DIV" : torch.true_divide,
+    "MOD" : torch.remainder,
+    "AND" : torch.bitwise_and,
+    "OR" : torch.bitwise_or,
+}
+OUT_UN_OPS = {
+    "MINUS" : torch.neg,
+    "NOT" : torch.bitwise_not,
+}
+
+def bin_op_tens(q, mem: MemoryManager, op, nxt, out_op=None):
+    (get_l, get_r), dev_to_use = _tens_readers(mem, [q[1], q[2]])
+    get_out = _out_reader(mem, out_op, [q[1], q[2]], q[3], dev_to_use)
+    if get_out is not None:
+        def handler():
+            out_op(get_l(), get_r(), out=get_out())
+            return nxt
+        return _to_host(mem, handler, [q[1], q[2]], q[3][3])
+    set_res = mem.slice_writer(q[3])
+    def handler():
+        res_tens = op(get_l(), get_r()).view(-1) # back to 1d
+        set_res(res_tens, len(res_tens))
+        return nxt
+    return _to_host(mem, handler, [q[1], q[2]], q[3][3])
+
+def fused_op(q, mem: MemoryManager, nxt):
+    # q = (FUSED, [input operand], [(op_name, operand, operand or None, result type id)], result)
+    # operands of a step index the inputs followed by the values of the steps before it, the last one is the result
+    inputs, program, res_dir = q[1], q[2], q[3]
+    tids = [mem_dir[3] for mem_dir, _ in inputs] + [step[3] for step in program]
+    readers, dev_to_use = _tens_readers(mem, inputs)
+    shapes, dtypes = [list(dims) for _, dims in inputs], [_dtype(mem, tid) for tid in tids]
+    args = [[l] if r is None else [l, r] for _, l, r, _ in program]
+    for step_args in args:
+        shapes.append(list(torch.broadcast_shapes(*(shapes[x] for x in step_args))))
+    res_shape, res_arena = shapes[-1], mem.arenas[tens_segment(res_dir[3])]
+    # values in between are never held by result memory which an input overlaps, the last one is
+    # computed in a new tensor and copied to it
+    res_on_dev = (res_arena.device.type == torch.device(dev_to_use).type
+        and not _aliases(res_dir, _size(res_shape), inputs))
+    get_res = mem.slice_view(res_dir, _size(res_shape))
+    steps, in_res = [], None # value in the result memory
+    for i, (op_name, l, r, tid) in enumerate(program):
+        op = OUT_UN_OPS[op_name] if r is None else OUT_BIN_OPS[op_name]
+        value = len(inputs) + i
+        shape, dtype = shapes[value], dtypes[value]
+        step_dtype = _result_dtype(op, [shapes[x] for x in args[i]], [dtypes[x] for x in args[i]])
+        res_fits = res_on_dev and shape == res_shape and dtype == res_arena.dtype
+        # the values in between keep the type of the temp they replace, the result memory holds them
+        # while it is free, the rest get a buffer once
+        if i == len(program) - 1 or (res_fits and (in_res is None or in_res in args[i])):
+            buf, in_res = None, value
+            direct = res_fits and step_dtype == dtype
+        else:
+            buf = torch.empty(shape, dtype=dtype, device=dev_to_use)
+            direct = step_dtype == dtype
+        steps.append((op, args[i], buf, direct))
+    def handler():
+        res = get_res().view(res_shape)
+        vals = [get_val() for get_val in readers]
+        for op, step_args, buf, direct in steps:
+            out = res if buf is None else buf
+            if direct:
+                op(*(vals[x] for x in step_args), out=out)
+            else: # the value is cast or moved to the device of its memory
+                out.copy_(op(*(vals[x] for x in step_args)))
+            vals.append(out)
+        return nxt
+    return _to_host(mem, handler, inputs, res_dir[3])
+
+def bin_op_string_tens(q, mem: MemoryManager, op, nxt):
+    l_dir, l_dims = q[1]
+    r_dir, _ = q[2]
+    # compiler checks that they both are same size for broadcast
+    l_size = _size(l_dims)
+    get_l = mem.slice_reader(l_dir, l_size)
+    get_r = mem.slice_reader(r_dir, l_size)
+    set_res = mem.slice_writer(q[3])
+    def handler():
+        # comparisons store their results in a torch BOOL_T tensor
+        set_res(torch.tensor(list(map(op, get_l(), get_r()))), l_size)
+        return nxt
+    return handler
+
+def bin_op_reg(q, mem: MemoryManager, op, nxt):
+    get_l, get_r, set_res = mem.reader(q[1]), mem.reader(q[2]), mem.writer(q[3])
+    def handler():
+        set_res(op(get_l(), get_r()))
+        return nxt
+    return handler
+
+def un_op_tens(q, mem: MemoryManager, op, nxt, out_op=None):
+    get_l = mem.tens_reader(*q[1])
+    get_out = _out_reader(mem, out_op, [q[1]], q[3], mem.device if q[1][0][3] >= 4 else 'cpu')
+    if get_out is not None:
+        def handler():
+            out_op(get_l(), out=get_out())
+            return nxt
+        return handler
+    set_res = mem.slice_writer(q[3])
+    def handler():
+        res_tens = op(get_l()).view(-1) # back to 1d
+        set_res(res_tens, len(res_tens))
+        return nxt
+    return handler
+
+def un_op_reg(q, mem: MemoryManager, op, nxt):
+    get_l, set_res = mem.reader(q[1]), mem.writer(q[3])
+    def handler():
+        set_res(op(get_l()))
+        return nxt
+    return handler
+
+def assig_op(q, mem: MemoryManager, nxt):
+    get_val, set_res = mem.reader(q[1]), mem.writer(q[3])
+    def handler():
+        set_res(get_val())
+        return nxt
+    return handler
+
+def copy_op(q, mem: MemoryManager, nxt):
+    # q = (COPY, origin base, # of elements, destination base)
+    copy = mem.copier(q[1], q[3], q[2])
+    def handler():
+        copy()
+        return nxt
+    return handler
+
+def param_op(q, mem: MemoryManager, nxt):
+    get_val, set_param = mem.reader(q[1]), mem.dorm_writer(q[3])
+    def handler():
+        set_param(get_val())
+        return nxt
+    return handler
+
+def verify_op(q, mem: MemoryManager, nxt):
+    get_index, get_limit = mem.reader(q[3]), mem.reader(q[1])
+    def handler():
+        index_val = get_index()
+        limit = get_limit()
+        if  index_val >= limit:
+            raise Exception(f"Out of bounds: tensor index with value {index_val} must be lower than {limit}")
+        return nxt
+    return handler
+
+def index_op(q, mem: MemoryManager, nxt, check=True):
+    # q = (INDEX, (tensor base, dims), [index per dim], first slot of the pointer)
+    # UNCHECKED_INDEX is the same without the bounds check, the compiler proved the indexes are in bounds
+    (tens_mem_dir, dims), indexes = q[1], q[2]
+    fid, base, _, tid = tens_mem_dir
+    strides = [_size(dims[i+1:]) for i in range(len(dims))]
+    checks = list(zip([mem.reader(index) for index in indexes], dims, strides))
+    p_fid, p_idx, _, p_tid = q[3]
+    set_fid, set_idx, set_deref, set_tid = (mem.writer((p_fid, p_idx + i, 0, p_tid)) for i in range(4))
+    def handler():
+        offset = 0
+        for get_index, limit, stride in checks:
+            index_val = get_index()
+            if check and index_val >= limit:
+                raise Exception(f"Out of bounds: tensor index with value {index_val} must be lower than {limit}")
+            offset += index_val * stride
+        set_fid(fid)
+        set_idx(base + offset)
+        set_deref(0)
+        set_tid(tid)
+        return nxt
+    return handler
+
+def unchecked_index_op(q, mem: MemoryManager, nxt):
+    return index_op(q, mem, nxt, check=False)
+
+def parse_input(input, type_str):
+    if type_str in ['INT_T', 'GPU_INT_T']:
+        return int(input)
+    elif type_str in ['FLOAT_T', 'GPU_FLOAT_T']:
+        return float(input)
+    elif type_str in ['BOOL_T', 'GPU_BOOL_T']:
+        return input == "True"
+    else: # string
+        return input
+
+def flatten_input(data, type, dims):
+    assert len(data) == dims[0]
+    flat = []
+    for item in data:
+        if isinstance(item, list):
+            flat.extend(flatten_input(item, type, dims[1:]))
+        else:
+            flat.append(parse_input(item, type))
+    return flat
+
+def _reader_of_input(q, mem: MemoryManager):
+    """
+    Returns a function which stores a read input (as a string) in the result of q.
+    """
+    if len(q[1]) > 1: # has tensor dims
+        type, dims = q[1][0], q[1][1:]
+        size = _size(dims)
+        set_res = mem.slice_writer(q[3])
+        if q[3][3] == 0: # STRING_T
+            return lambda input: set_res(flatten_input(eval(input), type, dims), size)
+        # all other types are stored in torch Tensors
+        return lambda input: set_res(torch.flatten(torch.tensor(eval(input))), size)
+    set_res = mem.writer(q[3])
+    return lambda input: set_res(parse_input(input, q[1][0]))
+
+def read_line_op(q, mem: MemoryManager, out: Output, nxt):
+    read = _reader_of_input(q, mem)
+    def handler():
+        out.flush() # what the program printed before asking
+        read(input())
+        return nxt
+    return handler
+
+def read_file_op(q, mem: MemoryManager, nxt):
+    read = _reader_of_input(q, mem)
+    get_filename = mem.reader(q[2])
+    def handler():
+        f = open(get_filename(), 'r')
+        data = f.read()
+        read(data)
+        return nxt
+    return handler
+
+def nest_from_dims(flat, dims):
+    if len(dims) == 1:
+        return list(flat)
+    step = len(flat) // dims[0]
+    return [nest_from_dims(flat[i*step:(i+1)*step], dims[1:]) for i in range(dims[0])]
+
+def _tens_data_reader(mem_dir, dims, mem: MemoryManager):
+    if mem_dir[3] == 0: # STRING_T, PTRs
+        get_strings = mem.slice_reader(mem_dir, _size(dims))
+        return lambda: nest_from_dims(get_strings(), dims)
+    # INT_T, FLOAT_T, BOOL_T
+    get_tens = mem.tens_reader(mem_dir, dims)
+    return lambda: get_tens().tolist()
+
+def write_to_file(q, mem: MemoryManager, nxt):
+    get_filename = mem.reader(q[3])
+    if q[2] != None: # has tensor dimensions
+        get_data = _tens_data_reader(q[1], q[2], mem)
+    elif q[1][3] > 3:
+        get_val = mem.reader(q[1])
+        get_data = lambda: get_val().item()
+    elif q[1][3] > 0:
+        # INT_T, FLOAT_T, BOOL_T are written as 0-d tensors
+        get_data = mem.tens_reader(q[1], [])
+    else:
+        get_data = mem.reader(q[1])
+    def handler():
+        f = open(get_filename(), "w")
+        f.write(str(get_data()))
+        return nxt
+    return handler
+
+def print_tens_op(q, mem: MemoryManager, out: Output, nxt):
+    mem_dir, dims = q[3]
+    if mem_dir[3] in GPU_TYPES:
+        get_tens = mem.tens_reader(mem_dir, dims)
+        def handler():
+            out.write_device("GPU({})", get_tens(), _tolist)
+            return nxt
+        return handler
+    get_data = _tens_data_reader(mem_dir, dims, mem)
+    def handler():
+        out.write(str(get_data()))
+        return nxt
+    return handler
+
+def print_reg_op(q, mem: MemoryManager, out: Output, nxt):
+    if q[3][2]: # pointers are resolved first to see data type
+        def handler():
+            resolved_mem_dir = mem.dereference(q[3])
+            print_val(out, resolved_mem_dir[3], mem.get_mem(resolved_mem_dir))
+            return nxt
+        return handler
+    tid, get_val = q[3][3], mem.reader(q[3])
+    if mem.is_scalar(q[3]):
+        def handler():
+            out.write(str(get_val()))
+            return nxt
+        return handler
+    def handler():
+        print_val(out, tid, get_val())
+        return nxt
+    return handler
+
+def item(val):
+    return val.item() if isinstance(val, torch.Tensor) else val
+
+def _item(val):
+    return val.item()
+
+def _tolist(val):
+    return val.tolist()
+
+def print_val(out: Output, tid, val):
+    if tid == 0: # STRING_T, PTRs
+        out.write(val.replace("\\n", "\n").replace('\\t','\t'))
+    elif tid <= 3: # INT_T, FLOAT_T, BOOL_T
+        out.write(str(item(val)))
+    else: # GPU_INT_T, GPU_FLOAT_T, GPU_BOOL_T, printed once the device computed them
+        out.write_device("GPU({})", val, _item)
+
+def matmul_long(x, y):
+    return torch.matmul(x.double(), y.double()).long()
+
+def matmul_double(x, y):
+    return torch.matmul(x.double(), y.double())
+
+def matrix_power_double(x, y):
+    return torch.matrix_power(x.double(), y)
+
+def _scalar_tensor(val):
+    # 0-d tensor of the dtype of the torch segment the scalar was kept in before
+    dtype = torch.bool if isinstance(val, bool) else torch.int64 if isinstance(val, int) else torch.float64
+    return torch.tensor(val, dtype=dtype)
+
+def _like_torch(op):
+    """
+    op on python scalars with the results torch gives, the cases python fails on (divisions by 0, float
+    overflows) or gives a complex for run on 0-d tensors: inf and nan instead of an error.
+    """
+    def run(x, y):
+        try:
+            res = op(x, y)
+            if not isinstance(res, complex):
+                return res
+        except (ZeroDivisionError, OverflowError):
+            pass
+        return op(_scalar_tensor(x), _scalar_tensor(y)).item()
+    return run
+
+def _pow(x, y):
+    if type(x) is int and type(y) is int:
+        if y < 0: # torch does not take negative int exponents
+            return (_scalar_tensor(x) ** y).item()
+        # INT_T results wrap around at 64 bits, the bits above are never computed
+        return pow(x, y, 2**64)
+    return x ** y
+
+scalar_div = _like_torch(operator.truediv)
+scalar_mod = _like_torch(operator.mod)
+scalar_pow = _like_torch(_pow)
+
+def all_eq(x, y):
+    return (x==y).all()
+
+def all_not_eq(x, y):
+    return (x!=y).all()
+
+def all_geqt(x, y):
+    return (x>=y).all()
+
+def all_leqt(x, y):
+    return (x<=y).all()
+
+def all_gt(x, y):
+    return (x>y).all()
+
+def all_lt(x, y):
+    return (x<y).all()
@@ -0,0 +1,45 @@
+import torch
+
+"""
+Output of the program. Printing a device value does not wait for the device to compute it: a copy of the value
+is queued and the queue is printed in batches, when it is full, before the program reads a line and when it
+ends. Text printed while values are pending is queued after them, so the output keeps its order.
+"""
+
+# pending device values printed together
+BATCH_SIZE = 64
+
+class Output():
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        # (format, device value or None, function which turns the host value into what the format prints)
+        self.pending = []
+        self.n_values = 0
+        # batches of device values read by the host
+        self.batches = 0
+
+    def write(self, text):
+        if self.pending:
+            self.pending.append((text, None, None))
+        else:
+            print(text, end='')
+
+    def write_device(self, fmt, val, to_data):
+        # the copy is queued on the device like any op, later writes to the memory of val do not change it
+        self.pending.append((fmt, val.clone(), to_data))
+        self.n_values += 1
+        if self.n_values >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        # all the values are copied to the host before the first one is read, the host waits once per batch
+        host_vals = [None if val is None else val.to("cpu", non_blocking=True) for _, val, _ in self.pending]
+        if any(val is not None and val.is_cuda for _, val, _ in self.pending):
+            torch.cuda.synchronize()
+        self.batches += 1
+        text = "".join(fmt if val is None else fmt.format(to_data(val))
+            for (fmt, _, to_data), val in zip(self.pending, host_vals))
+        self.pending, self.n_values = [], 0
+        print(text, end='')
@@ -0,0 +1,46 @@
+import json
+import sys
+import pytest
+from lexer_parser.lexer import ParhlLexer
+from lexer_parser.parser import ParhlParser
+from lexer_parser.structs import binary_ir
+from lexer_parser.structs.parse_context import ParseContext
+from lexer_parser.structs.var_dir import Block
+from ..interpreter import run_global
+
+def load_ir(ir_f):
+    with open(ir_f, 'r') as ir_file:
+        ir = json.load(ir_file)
+    return ir["func_dir"], ir["quads"]
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_recursion_deeper_than_python_stack(capsys, tmp_path, binary):
+    func_dir, quads = load_ir("./virtual_machine/tests/data/sum_rec.out")
+    depth = 2 * sys.getrecursionlimit()
+    func_dir[0][1]["INT_T"][0][0] = depth # sum(n) argument
+    if binary: # lazily decoded quads
+        binary_ir.dump({"func_dir": func_dir, "quads": quads}, tmp_path / "sum_rec.pbc")
+        func_dir, quads = binary_ir.load(tmp_path / "sum_rec.pbc")
+    run_global(func_dir, quads, lazy=binary)
+    assert capsys.readouterr().out == f"{depth * (depth + 1) // 2}\n"
+
+def test_device_prints_are_deferred(capsys, monkeypatch):
+    monkeypatch.setattr(Block, "_ID_COUNTER", 0) # func ids index the func dir
+    ctx = ParseContext()
+    ParhlParser().parse(ParhlLexer().tokenize("""
+let g : gpu_int := 0
+let t[3] : gpu_int := [1, 2, 3]
+while(g < 3){
+    g := g + 1
+    t := t + g
+    print(g, " ", t, "\\n")
+}
+print("done\\n")
+""")).gen(ctx)
+    ir = ctx.to_ir_repr()
+    mem, out = run_global(ir["func_dir"], ir["quads"])
+    # the values are printed as they were when print ran, all in a single batch at the end
+    assert capsys.readouterr().out == "GPU(1) GPU([2, 3, 4])\nGPU(2) GPU([4, 5, 6])\nGPU(3) GPU([7, 8, 9])\ndone\n"
+    assert out.batches == 1
+    # the loop condition is a gpu_bool, every check waits for the device
+    assert mem.syncs == 4
@@ -0,0 +1,75 @@
+import torch
+from ..memory import MemoryManager, INITIAL_ARENA_SIZE
+
+def func_record(ints=0, floats=0, int_tens_regions=None, consts=None, tens_consts=None, gpu_int_tens_regions=None):
+    cpu_var_counter = {"STRING_T": 0, "INT_T": ints, "FLOAT_T": floats, "BOOL_T": 0}
+    gpu_ints = sum(size for _, size in gpu_int_tens_regions or [])
+    gpu_var_counter = {"GPU_INT_T": gpu_ints, "GPU_FLOAT_T": 0, "GPU_BOOL_T": 0}
+    tens_regions = {"INT_T": int_tens_regions} if int_tens_regions else {}
+    if gpu_int_tens_regions:
+        tens_regions["GPU_INT_T"] = gpu_int_tens_regions
+    return [cpu_var_counter, consts or {}, gpu_var_counter, tens_regions, tens_consts or {}, None]
+
+def test_frames_are_stacked_windows():
+    mem = MemoryManager([func_record(ints=2), func_record(ints=1)])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    set_glob, get_glob = mem.writer((0, 1, 0, 1)), mem.reader((0, 1, 0, 1))
+    set_func, get_func = mem.writer((1, 0, 0, 1)), mem.reader((1, 0, 0, 1))
+    set_glob(7)
+    for depth in range(3): # recursion, one frame per call
+        mem.era_func_stack(1)
+        mem.start_func_stack(1)
+        set_func(depth)
+    assert get_func() == 2 and mem.stack_pointers[1] == 5
+    mem.end_func_stack(1)
+    assert get_func() == 1 and mem.stack_pointers[1] == 4
+    mem.end_func_stack(1)
+    mem.end_func_stack(1)
+    assert get_glob() == 7 and mem.stack_pointers[1] == 2
+
+def test_arena_grows_in_place():
+    size = INITIAL_ARENA_SIZE // 2 + 1
+    mem = MemoryManager([func_record(int_tens_regions=[[0, size]]), func_record(int_tens_regions=[[0, size]])])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    glob_tens, func_tens = ((0, 0, 0, 1), [size]), ((1, 0, 0, 1), [size])
+    mem.slice_writer(glob_tens[0])(torch.arange(size), size)
+    arena = mem.arenas[7]
+    mem.era_func_stack(1)
+    mem.start_func_stack(1)
+    mem.slice_writer(func_tens[0])(torch.ones(size, dtype=torch.int64), size)
+    assert mem.arenas[7] is arena and len(arena) == 2 * INITIAL_ARENA_SIZE
+    assert torch.equal(mem.tens_reader(*glob_tens)(), torch.arange(size))
+    assert torch.equal(mem.tens_reader(*func_tens)(), torch.ones(size, dtype=torch.int64))
+
+def test_consts_are_shared_by_frames():
+    consts = {"INT_T": [[42, [1, 1, 0, 1]]], "FLOAT_T": [[0.5, [1, 0, 0, 2]]]}
+    mem = MemoryManager([func_record(), func_record(ints=2, floats=1, consts=consts)])
+    get_int, get_float = mem.reader((1, 1, 0, 1)), mem.reader((1, 0, 0, 2))
+    for _ in range(2):
+        mem.era_func_stack(1)
+        mem.start_func_stack(1)
+    assert get_int() == 42 and get_float() == 0.5
+    # constants live once below the frames
+    assert mem.stack_pointers[1] == 1 + 2 * 2 and mem.stack_pointers[2] == 1 + 2 * 1
+
+def test_copier_mixes_consts_and_vars():
+    # slots 0-1 are consts, 2 is a var and 3-5 a tensor
+    consts = {"INT_T": [[4, [0, 0, 0, 1]], [5, [0, 1, 0, 1]]]}
+    mem = MemoryManager([func_record(ints=6, int_tens_regions=[[3, 3]], consts=consts)])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    mem.writer((0, 2, 0, 1))(6)
+    assert not mem.is_contiguous((0, 0, 0, 1), 3) and mem.is_contiguous((0, 0, 0, 1), 2)
+    mem.copier((0, 0, 0, 1), (0, 3, 0, 1), 3)()
+    assert mem.tens_reader((0, 3, 0, 1), [3])().tolist() == [4, 5, 6]
+
+def test_tensor_literals_are_loaded_once():
+    tens_consts = {"INT_T": [[[1, 2, 3, 4], [0, 0, 0, 1]]]}
+    mem = MemoryManager([func_record(ints=4, int_tens_regions=[[0, 4]], tens_consts=tens_consts)])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    assert mem.tens_reader((0, 0, 0, 1), [2, 2])().tolist() == [[1, 2], [3, 4]]
+    # the literal once below the frame, the frame does not reserve slots for it
+    assert mem.stack_pointers[7] == 4
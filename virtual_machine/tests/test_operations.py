@@ -0,0 +1,111 @@
+import operator
+import torch
+from ..memory import INITIAL_ARENA_SIZE, INT64_MAX, INT64_MIN, MemoryManager
+from ..operations import bin_op_reg, bin_op_tens, un_op_tens, scalar_div, scalar_pow, OUT_BIN_OPS, OUT_UN_OPS
+from .test_memory import func_record
+
+def int_tens_mem():
+    # 3 int tensors of 3 elements
+    mem = MemoryManager([func_record(int_tens_regions=[[0, 3], [3, 3], [6, 3]])])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    mem.slice_writer((0, 0, 0, 1))(torch.tensor([7, 8, 9]), 3)
+    mem.slice_writer((0, 3, 0, 1))(torch.tensor([1, 2, 3]), 3)
+    return mem
+
+def test_tens_ops_write_in_place(monkeypatch):
+    mem = int_tens_mem()
+    a, b, res = ((0, 0, 0, 1), [3]), ((0, 3, 0, 1), [3]), (0, 6, 0, 1)
+    # the result is never copied to the frame, the ops write the view of its memory
+    monkeypatch.setattr(mem, "slice_writer", None)
+    bin_op_tens(("MINUS", a, b, res), mem, operator.sub, 1, OUT_BIN_OPS["MINUS"])()
+    assert torch.equal(mem.tens_reader(res, [3])(), torch.tensor([6, 6, 6]))
+    un_op_tens(("MINUS", b, None, res), mem, operator.neg, 1, OUT_UN_OPS["MINUS"])()
+    assert torch.equal(mem.tens_reader(res, [3])(), torch.tensor([-1, -2, -3]))
+
+def test_tens_ops_fall_back_to_copies():
+    mem = int_tens_mem()
+    a, b, res = ((0, 0, 0, 1), [3]), ((0, 3, 0, 1), [3]), (0, 6, 0, 1)
+    # an int division gives floats, they are cast to the int result like any stored value
+    bin_op_tens(("DIV", a, b, res), mem, operator.truediv, 1, OUT_BIN_OPS["DIV"])()
+    assert torch.equal(mem.tens_reader(res, [3])(), torch.tensor([7, 4, 3]))
+
+def test_host_tensors_move_to_the_device_once():
+    # the cpu stands in for the device, residency follows the type of the memory
+    mem = MemoryManager([func_record(int_tens_regions=[[0, 3], [3, 3]], gpu_int_tens_regions=[[0, 3]])])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    a, g = ((0, 0, 0, 1), [3]), ((0, 0, 0, 4), [3])
+    mem.slice_writer((0, 0, 0, 1))(torch.tensor([1, 2, 3]), 3)
+    mem.slice_writer((0, 0, 0, 4))(torch.zeros(3, dtype=torch.int64), 3)
+    add = bin_op_tens(("PLUS", g, a, g[0]), mem, operator.add, 1, OUT_BIN_OPS["PLUS"])
+    for _ in range(3):
+        add()
+    assert mem.transfers == 1
+    assert torch.equal(mem.tens_reader(*g)(), torch.tensor([3, 6, 9]))
+    # a write of the host tensor invalidates its device copy, a host result is moved back
+    mem.writer((0, 1, 0, 1))(5)
+    add()
+    assert mem.transfers == 2
+    assert torch.equal(mem.tens_reader(*g)(), torch.tensor([4, 11, 12]))
+    bin_op_tens(("PLUS", g, a, (0, 3, 0, 1)), mem, operator.add, 1, OUT_BIN_OPS["PLUS"])()
+    assert mem.transfers == 3
+    assert torch.equal(mem.tens_reader((0, 3, 0, 1), [3])(), torch.tensor([5, 16, 15]))
+
+def scalar_mem():
+    mem = MemoryManager([func_record(ints=3, floats=3)])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    return mem
+
+def test_scalar_division_by_zero_gives_inf_and_nan():
+    mem = scalar_mem()
+    a, b, res = (0, 0, 0, 2), (0, 1, 0, 2), (0, 2, 0, 2)
+    mem.writer(a)(1.5)
+    mem.writer(b)(0.0)
+    get_res = mem.reader(res)
+    bin_op_reg(("DIV", a, b, res), mem, scalar_div, 1)()
+    assert get_res() == float("inf")
+    bin_op_reg(("DIV", b, b, res), mem, scalar_div, 1)()
+    assert get_res() != get_res() # nan
+    # an int result is cast like torch casts inf to int64
+    i, z, i_res = (0, 0, 0, 1), (0, 1, 0, 1), (0, 2, 0, 1)
+    mem.writer(i)(7)
+    mem.writer(z)(0)
+    bin_op_reg(("DIV", i, z, i_res), mem, scalar_div, 1)()
+    inf_as_int = torch.tensor(float("inf"), dtype=torch.float64).long().item()
+    assert mem.reader(i_res)() == inf_as_int
+    # so is the 0-d tensor of an op on a tensor element
+    mem.writer(i_res)(torch.tensor(float("inf"), dtype=torch.float64))
+    assert mem.reader(i_res)() == inf_as_int
+
+def test_scalar_ints_wrap_around():
+    mem = scalar_mem()
+    x, y, res = (0, 0, 0, 1), (0, 1, 0, 1), (0, 2, 0, 1)
+    mem.writer(x)(2)
+    mem.writer(y)(70)
+    get_res = mem.reader(res)
+    bin_op_reg(("EXP", x, y, res), mem, scalar_pow, 1)()
+    assert get_res() == 0
+    mem.writer(x)(3)
+    mem.writer(y)(41)
+    bin_op_reg(("EXP", x, y, res), mem, scalar_pow, 1)()
+    assert get_res() == (torch.tensor(3) ** 41).item()
+    mem.writer(x)(INT64_MAX)
+    mem.writer(y)(1)
+    bin_op_reg(("PLUS", x, y, res), mem, operator.add, 1)()
+    assert get_res() == INT64_MIN
+
+def test_unassigned_scalars_have_a_value():
+    # the second frame does not fit in the arenas, the slots they grow by are set too
+    mem = MemoryManager([func_record(ints=2, floats=1), func_record(ints=INITIAL_ARENA_SIZE, floats=1)])
+    mem.era_func_stack(0)
+    mem.start_func_stack(0)
+    mem.era_func_stack(1)
+    mem.start_func_stack(1)
+    for fid in (0, 1):
+        x, res, f = (fid, 0, 0, 1), (fid, 1, 0, 1), (fid, 0, 0, 2)
+        bin_op_reg(("PLUS", x, x, res), mem, operator.add, 1)()
+        assert mem.reader(res)() == 0
+        bin_op_reg(("MULT", f, f, f), mem, operator.mul, 1)()
+        assert mem.reader(f)() == 0.0